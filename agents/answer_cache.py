@@ -0,0 +1,177 @@
+# agents/answer_cache.py
+# Persistent caches for /query (SQLite)
+#
+# Two tables:
+# - answers: the full response, reused only for the same agent, the same question up to
+#   case/whitespace/trailing punctuation, the same column schema and the same dataset version.
+# - code: the validated code the LLM generated, keyed without the dataset version, so a
+#   question asked again after a data refresh is answered by re-running it, with no LLM call.
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", ".query_cache/answers.sqlite")
+# Seconds an answer stays valid even if the data does not change
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+# Least recently used answers are dropped above this many bytes of stored responses
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_MB", "64")) * 1024 * 1024
+# Generated code only goes stale when the columns change, so it is kept much longer
+CODE_CACHE_TTL = int(os.getenv("CODE_CACHE_TTL", str(30 * 24 * 3600)))
+CODE_CACHE_MAX_BYTES = int(os.getenv("CODE_CACHE_MAX_MB", "16")) * 1024 * 1024
+
+TABLES = ("answers", "code")
+
+
+def normalize_question(question: str) -> str:
+    text = unicodedata.normalize("NFKC", question).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(" ?!.")
+
+
+def schema_signature(df) -> str:
+    """Hash of the column names and dtypes the generated code ran against"""
+    schema = "|".join(f"{col}:{dtype}" for col, dtype in df.dtypes.items())
+    return hashlib.sha1(schema.encode()).hexdigest()[:16]
+
+
+def answer_key(agent: str, question: str, schema: str, version: str) -> str:
+    raw = json.dumps([agent, normalize_question(question), schema, version])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def code_key(agent: str, question: str, schema: str) -> str:
+    raw = json.dumps([agent, normalize_question(question), schema])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class AnswerCache:
+    def __init__(
+        self,
+        path=ANSWER_CACHE_PATH,
+        ttl=ANSWER_CACHE_TTL,
+        max_bytes=ANSWER_CACHE_MAX_BYTES,
+        code_ttl=CODE_CACHE_TTL,
+        code_max_bytes=CODE_CACHE_MAX_BYTES,
+    ):
+        self.path = path
+        # table -> (ttl, max_bytes)
+        self.limits = {"answers": (ttl, max_bytes), "code": (code_ttl, code_max_bytes)}
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            for table in TABLES:
+                conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        key TEXT PRIMARY KEY,
+                        agent TEXT NOT NULL,
+                        question TEXT NOT NULL,
+                        response TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        created_at REAL NOT NULL,
+                        last_used REAL NOT NULL
+                    )
+                """)
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_used ON {table} (last_used)")
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str):
+        """Cached result dict for `key`, or None when missing or older than the TTL"""
+        return self._get("answers", key)
+
+    def put(self, key: str, agent: str, question: str, result: dict):
+        self._put("answers", key, agent, question, result)
+
+    def get_code(self, key: str):
+        """{"answer", "code"} generated earlier for `key`, or None"""
+        return self._get("code", key)
+
+    def put_code(self, key: str, agent: str, question: str, answer: str, code: str):
+        self._put("code", key, agent, question, {"answer": answer, "code": code})
+
+    def drop_code(self, key: str):
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute("DELETE FROM code WHERE key = ?", (key,))
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Code cache delete failed: {e}")
+
+    def _get(self, table, key):
+        ttl, _ = self.limits[table]
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute(
+                    f"SELECT response, created_at FROM {table} WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if time.time() - row[1] > ttl:
+                    conn.execute(f"DELETE FROM {table} WHERE key = ?", (key,))
+                    conn.commit()
+                    return None
+                conn.execute(f"UPDATE {table} SET last_used = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+            return json.loads(row[0])
+        except sqlite3.Error as e:
+            logger.warning(f"Query cache read from {table} failed: {e}")
+            return None
+
+    def _put(self, table, key, agent, question, value):
+        try:
+            # default=str keeps timestamps and numpy scalars in the result records
+            response = json.dumps(value, default=str)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Entry for '{question}' is not cacheable: {e}")
+            return
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, agent, question, response, len(response), now, now),
+                )
+                self._evict(conn, table, now)
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Query cache write to {table} failed: {e}")
+
+    def _evict(self, conn, table, now):
+        ttl, max_bytes = self.limits[table]
+        conn.execute(f"DELETE FROM {table} WHERE created_at < ?", (now - ttl,))
+        total = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {table}").fetchone()[0]
+        if total <= max_bytes:
+            return
+        for key, size in conn.execute(f"SELECT key, size FROM {table} ORDER BY last_used").fetchall():
+            if total <= max_bytes:
+                break
+            conn.execute(f"DELETE FROM {table} WHERE key = ?", (key,))
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            for table in TABLES:
+                conn.execute(f"DELETE FROM {table}")
+            conn.commit()
+
+
+answer_cache = AnswerCache()
@@ -1,13 +1,12 @@
 from langchain.prompts import PromptTemplate
 from langchain_core.runnables import RunnableSequence
-from langchain_ollama import OllamaLLM
+import ast
 import logging
 import re
 
-logger = logging.getLogger(__name__)
+from agents.llm_client import get_llm, invoke_llm, run_tiers
 
-# Initialize the LLM
-fix_llm = OllamaLLM(model="mistral", temperature=0)
+logger = logging.getLogger(__name__)
 
 # Updated strict prompt
 code_fix_prompt = PromptTemplate(
@@ -31,22 +30,36 @@ Broken code:
 """
 )
 
-code_fixer_chain: RunnableSequence = code_fix_prompt | fix_llm
+# Code fixing chain for one model tier (see MODEL_TIERS["code_fix"])
+def code_fixer_chain(model: str) -> RunnableSequence:
+    return code_fix_prompt | get_llm(model)
 
-def fix_invalid_code(code: str) -> str:
-    logger.info("🛠 Fixing invalid Python code via code_fixer_agent...")
+# Accepted output of a code fix tier: parses and assigns `result`
+def is_fixed(code: str) -> bool:
+    if not code or "result" not in code:
+        return False
     try:
-        fixed_code = code_fixer_chain.invoke({"code": code}).strip()
+        ast.parse(code)
+        return True
+    except SyntaxError:
+        return False
 
-        # Auto-fix if LLM still returned print(...) instead of result = ...
-        if "print(" in fixed_code:
-            print_matches = re.findall(r"print\s*\(\s*(.*)\s*\)", fixed_code)
-            if print_matches:
-                logger.warning("⚠️ Detected print() in LLM-fixed code. Rewriting as assignment to `result`.")
-                return f"result = {print_matches[-1]}"
+def fix_with_llm(code: str, model: str) -> str:
+    fixed_code = invoke_llm(code_fixer_chain(model), {"code": code}, model, prompt=f"code_fix/{model}").strip()
 
-        return fixed_code
+    # Auto-fix if LLM still returned print(...) instead of result = ...
+    if "print(" in fixed_code:
+        print_matches = re.findall(r"print\s*\(\s*(.*)\s*\)", fixed_code)
+        if print_matches:
+            logger.warning(f"⚠️ Detected print() in code fixed by {model}. Rewriting as assignment to `result`.")
+            return f"result = {print_matches[-1]}"
 
-    except Exception as e:
-        logger.error(f"❌ Failed to fix code via code_fixer_agent: {e}")
+    return fixed_code
+
+def fix_invalid_code(code: str) -> str:
+    logger.info("🛠 Fixing invalid Python code via code_fixer_agent...")
+    fixed_code = run_tiers("code_fix", lambda model: fix_with_llm(code, model), is_fixed)
+    if fixed_code is None:
+        logger.error("❌ Failed to fix code via code_fixer_agent: every model tier failed")
         return code
+    return fixed_code
@@ -1,14 +1,13 @@
 from langchain.prompts import PromptTemplate
 from langchain_core.runnables import RunnableSequence
-from langchain_ollama import OllamaLLM
 import json
 import logging
 import re
 
-logger = logging.getLogger(__name__)
+from agents.llm_client import get_llm, invoke_llm, run_tiers
+from agents.query_metrics import count
 
-# Load LLM
-format_llm = OllamaLLM(model="mistral", temperature=0)
+logger = logging.getLogger(__name__)
 
 # Strict prompt to enforce output format and avoid escaping issues
 format_prompt = PromptTemplate(
@@ -38,23 +37,117 @@ Raw Output:
 """
 )
 
-# Build formatting chain
-format_chain: RunnableSequence = format_prompt | format_llm
+# Formatting chain for one model tier (see MODEL_TIERS["format"])
+def format_chain(model: str) -> RunnableSequence:
+    return format_prompt | get_llm(model)
 
 # Extract the first JSON object from a blob of text
 def extract_json_from_text(text: str) -> str:
     match = re.search(r'{[\s\S]*}', text)
     return match.group(0).strip() if match else ""
 
+# Escapes JSON allows. `\_` (from markdown-minded models) loses its backslash; any other
+# `\x` is code the model did not escape for JSON (e.g. the regex '\d+'), so it is doubled
+# to keep the backslash in the decoded string
+JSON_ESCAPES = set('"\\/bfnrtu')
+
+def _fix_escape(match) -> str:
+    ch = match.group(1)
+    if ch in JSON_ESCAPES:
+        return match.group(0)
+    if ch == "_":
+        return "_"
+    return "\\\\" + ch
+
+def fix_escapes(text: str) -> str:
+    return re.sub(r"\\(.)", _fix_escape, text, flags=re.S)
+
+# Closed ```json ... ``` fences
+CODE_FENCE = re.compile(r"```(?:json|JSON)?\s*([\s\S]*?)```")
+
+# First balanced {...} in the text, honouring braces inside JSON strings
+def extract_json_object(text: str) -> str:
+    start = text.find("{")
+    if start < 0:
+        return ""
+    depth = 0
+    in_string = escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return ""
+
+# Local strict parse of the raw model output; None when the format agent is needed
+def parse_llm_output(raw_output: str):
+    fenced = CODE_FENCE.search(raw_output)
+    candidates = [fenced.group(1)] if fenced else []
+    candidates.append(raw_output)
+
+    for text in candidates:
+        blob = extract_json_object(text)
+        if not blob:
+            continue
+        try:
+            # strict=False accepts raw newlines/tabs inside the code string
+            parsed = json.loads(fix_escapes(blob), strict=False)
+        except json.JSONDecodeError:
+            continue
+        if (
+            isinstance(parsed, dict)
+            and isinstance(parsed.get("answer"), str)
+            and isinstance(parsed.get("code"), str)
+            and parsed["code"].strip()
+        ):
+            return parsed
+    return None
+
 # Main function to fix and parse LLM output
 def fix_llm_output(raw_output: str) -> dict:
-    logger.info("Running LLM format enforcement agent...")
+    parsed = parse_llm_output(raw_output)
+    if parsed is not None:
+        count("format.local")
+        return parsed
 
+    logger.info("Running LLM format enforcement agent...")
+    count("format.llm")
+
+    parsed = run_tiers("format", lambda model: format_with_llm(raw_output, model), is_formatted)
+    if parsed is None or not is_formatted(parsed):
+        count("format.failed")
+        return parsed or {"error": "parsing_failed"}
+    return parsed
+
+# Accepted output of a format tier: a string answer and some string code
+def is_formatted(parsed) -> bool:
+    return (
+        isinstance(parsed, dict) and "error" not in parsed
+        and isinstance(parsed.get("answer"), str)
+        and isinstance(parsed.get("code"), str) and bool(parsed["code"].strip())
+    )
+
+# One format tier: the model's corrected output, parsed, or {"error": ...}. Errors calling
+# the model propagate so run_tiers can mark it unavailable; anything wrong with its output
+# becomes an error result and the next tier is tried.
+def format_with_llm(raw_output: str, model: str) -> dict:
+    corrected = invoke_llm(format_chain(model), {"raw_output": raw_output}, model, prompt=f"format/{model}")
     try:
-        corrected = format_chain.invoke({"raw_output": raw_output}).strip()
-        corrected = corrected.replace("\\_", "_")  # Fix invalid escapes
+        corrected = corrected.strip().replace("\\_", "_")  # Fix invalid escapes
 
-        logger.info(f"Formatted output:\n{corrected}")
+        logger.info(f"Formatted output from {model}:\n{corrected}")
 
         if '"error": "invalid"' in corrected.lower():
             return {"error": "invalid"}
@@ -64,6 +157,8 @@ def fix_llm_output(raw_output: str) -> dict:
             return {"error": "no_json_found"}
 
         parsed = json.loads(cleaned_json_str)
+        if not isinstance(parsed, dict):
+            return {"error": "not_an_object"}
 
         # Fallback: try extracting answer if it’s missing
         fallback_answer_match = re.search(r'"answer"\s*:\s*"([^"]*)"', raw_output)
@@ -75,8 +170,11 @@ def fix_llm_output(raw_output: str) -> dict:
         if "answer" not in parsed or "code" not in parsed:
             return {"error": "missing_keys"}
 
+        if not isinstance(parsed["answer"], str) or not isinstance(parsed["code"], str):
+            return {"error": "invalid_types"}
+
         return parsed
 
     except Exception as e:
-        logger.error(f"FormatAgent failed to parse corrected output: {e}")
+        logger.error(f"FormatAgent ({model}) failed to parse corrected output: {e}")
         return {"error": "parsing_failed"}
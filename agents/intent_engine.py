@@ -0,0 +1,392 @@
+# agents/intent_engine.py
+# Rule-based answers for the common question shapes, tried before the LLM
+#
+# Questions such as "top 5 products by revenue", "average ROI by region", "which supplier
+# has the highest total cost" or "total sales for the north region" are matched against a
+# few templates. Their phrases are mapped onto columns through a synonym index built from
+# the column names, and the answer is one vectorised group-by. Anything that does not match
+# a template cleanly returns None and is left to the LLM.
+
+import logging
+import re
+import threading
+import weakref
+from difflib import get_close_matches
+
+import pandas as pd
+
+from agents.sandbox import shape_result
+
+logger = logging.getLogger(__name__)
+
+# User wording -> candidate columns, first one present in the dataset wins
+SYNONYMS = {
+    "sales": ["Total_Sales", "Revenue"],
+    "revenue": ["Revenue", "Total_Sales"],
+    "income": ["Revenue", "Total_Sales"],
+    "profit": ["Net Profit", "Profit"],
+    "earnings": ["Net Profit", "Profit"],
+    "return on investment": ["ROI (%)"],
+    "cost": ["Total Cost", "Expenses"],
+    "costs": ["Total Cost", "Expenses"],
+    "spend": ["Expenses", "Total Cost", "Logistics Spend"],
+    "spending": ["Expenses", "Total Cost", "Logistics Spend"],
+    "emissions": ["Carbon Emission (kg)"],
+    "carbon": ["Carbon Emission (kg)"],
+    "delay": ["Transportation_Delay_Days"],
+    "delivery time": ["Avg Delivery Time (Days)", "Lead Time (Days)"],
+    "lead time": ["Lead Time (Days)"],
+    "aging": ["PO Aging (Days)"],
+    "rating": ["Supplier Rating"],
+    "growth": ["Projected Growth (%)"],
+    "impact": ["Initiative Impact Score"],
+    "risk": ["Risk Score"],
+    "turnover": ["Inventory_Turnover"],
+    "price": ["Product_Price"],
+    "discount": ["Discount_Rate"],
+    "fulfillment rate": ["Order Fulfillment Rate (%)"],
+    "product": ["Product Name"],
+    "supplier": ["Supplier Name"],
+    "vendor": ["Supplier Name"],
+    "country": ["Supplier Country"],
+    "region": ["Region", "Order_Region"],
+    "area": ["Region", "Order_Region"],
+    "warehouse": ["Warehouse ID"],
+    "store": ["Store ID"],
+    "initiative": ["Strategic Initiative"],
+    "segment": ["Customer_Segment"],
+    "customer": ["Customer_Segment"],
+    "shipping mode": ["Shipping_Mode"],
+    "status": ["Order_Status", "Risk Status"],
+}
+
+# Aggregation wording -> pandas aggregation
+AGGREGATIONS = {
+    "total": "sum", "sum of": "sum", "sum": "sum", "overall": "sum",
+    "average": "mean", "avg": "mean", "mean": "mean", "median": "median",
+    "maximum": "max", "max": "max", "highest": "max", "minimum": "min", "min": "min", "lowest": "min",
+    "number of": "count", "count of": "count", "count": "count",
+}
+AGGREGATION_LABELS = {"sum": "total", "mean": "average", "median": "median", "max": "maximum", "min": "minimum"}
+
+# Columns holding rates, scores and durations are averaged unless the question says otherwise
+AVERAGED = re.compile(r"\b(pct|rate|ratio|score|rating|accuracy|day|time|duration|price|aging|per|turnover|utilization)\b")
+
+# "Top 5 orders by profit" ranks rows rather than groups
+ROW_WORDS = {"row", "record", "order", "entry", "item", "transaction", "purchase order", "po"}
+
+DEFAULT_TOP_N = 5
+# Categorical columns with at most this many values can be named in "for <value>" questions
+MAX_VALUE_INDEX = 100
+
+# Wording the templates cannot express (compounds, negations, exclusions); left to the LLM
+COMPOUND = re.compile(
+    r"\b(?:and|or|non|not|no|nor|except|excluding|exclude|without|besides|other than|apart from|but|vs|versus)\b"
+)
+# Grouping clauses; the templates handle at most one
+GROUPING = re.compile(r"\b(?:by|per|for each|for every|in each|across|broken down by|grouped by|split by)\b")
+# Ranking qualifiers; a question may only contain the one its template uses
+QUALIFIER = re.compile(
+    r"\b(?:top|bottom|first|last|best|worst|highest|lowest|largest|smallest|greatest|most|least|"
+    r"maximum|minimum|max|min)\b"
+)
+
+_AGG = "|".join(sorted(map(re.escape, AGGREGATIONS), key=len, reverse=True))
+FILLER = re.compile(
+    r"^(?:(?:please|can you|could you|show me|show|list|give me|tell me|find|get|display|"
+    r"what is|what's|what are|whats)\s+)+"
+)
+TEMPLATES = [
+    ("top_n", re.compile(
+        r"^(?:the\s+)?(?P<direction>top|bottom|best|worst|highest|lowest)\s+(?P<n>\d+)?\s*(?P<dim>.+?)\s+"
+        r"(?:by|based on|in terms of|ranked by|sorted by)\s+(?P<measure>.+)$"
+    )),
+    ("extreme", re.compile(
+        r"^(?:which|what)\s+(?P<dim>.+?)\s+(?:has|had|have|is|shows|with|got)\s+(?:the\s+)?"
+        r"(?P<direction>highest|lowest|most|least|best|worst|largest|smallest|greatest|maximum|minimum|top)\s+"
+        r"(?P<measure>.+)$"
+    )),
+    ("group_by", re.compile(
+        rf"^(?:the\s+)?(?P<agg>{_AGG})\s+(?:the\s+)?(?P<measure>.+?)\s+"
+        r"(?:by|per|for each|for every|in each|across|across all|broken down by|grouped by|split by)\s+(?P<dim>.+)$"
+    )),
+    ("filtered", re.compile(
+        rf"^(?:the\s+)?(?P<agg>{_AGG})\s+(?:the\s+)?(?P<measure>.+?)\s+(?:for|in|of|at|from)\s+(?P<value>.+)$"
+    )),
+    ("overall", re.compile(rf"^(?:the\s+)?(?P<agg>{_AGG})\s+(?:the\s+)?(?P<measure>.+)$")),
+]
+
+
+def _singular(word):
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def normalize(text: str) -> str:
+    """Lowercase, '%' as 'pct', punctuation and underscores as spaces, words made singular"""
+    text = text.lower().replace("%", " pct ")
+    words = re.sub(r"[^a-z0-9]+", " ", text).split()
+    return " ".join(_singular(word) for word in words)
+
+
+# SYNONYMS keyed the way resolve() sees a phrase ("emissions" -> "emission")
+NORMALIZED_SYNONYMS = {normalize(word): columns for word, columns in SYNONYMS.items()}
+
+
+def column_phrases(column: str) -> set:
+    """The ways a question may name `column`: in full and without its unit"""
+    full = normalize(column)
+    bare = normalize(re.sub(r"\(.*?\)", " ", column))
+    bare = re.sub(r"\s+pct$", "", bare)
+    return {phrase for phrase in (full, bare) if phrase}
+
+
+class Schema:
+    """Measures, dimensions and the lookup indexes for one DataFrame"""
+
+    def __init__(self, df: pd.DataFrame):
+        numeric = [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col])]
+        self.measures = [col for col in numeric if not re.search(r"\bid\b", normalize(col))]
+        self.dimensions = [col for col in df.columns if col not in numeric]
+        self.phrases = {}  # phrase -> column
+        for col in df.columns:
+            for phrase in column_phrases(col):
+                self.phrases.setdefault(phrase, col)
+        self.values = {}  # normalized category value -> (column, value)
+        for col in self.dimensions:
+            uniques = df[col].dropna().unique()
+            if len(uniques) <= MAX_VALUE_INDEX:
+                for value in uniques:
+                    self.values.setdefault(normalize(str(value)), (col, value))
+
+    def resolve(self, phrase: str, candidates: list):
+        """Column among `candidates` that `phrase` names, or None"""
+        phrase = normalize(re.sub(r"^(?:the|a|an|each|every|all)\s+", "", phrase.strip()))
+        if not phrase:
+            return None
+        col = self.phrases.get(phrase)
+        if col in candidates:
+            return col
+        for col in NORMALIZED_SYNONYMS.get(phrase, ()):
+            if col in candidates:
+                return col
+        # Every word of the phrase appears in the column name ("delay" -> Transportation_Delay_Days)
+        words = set(phrase.split())
+        matches = [col for col in candidates if words <= set(normalize(col).split())]
+        if matches:
+            return min(matches, key=len)
+        close = get_close_matches(phrase, [normalize(col) for col in candidates], n=1, cutoff=0.85)
+        if close:
+            return next(col for col in candidates if normalize(col) == close[0])
+        return None
+
+    def value(self, phrase: str):
+        """(column, value) for a category value named in `phrase` ("the north region"), or None"""
+        phrase = normalize(re.sub(r"^(?:the|a|an)\s+", "", phrase.strip()))
+        if phrase in self.values:
+            return self.values[phrase]
+        # Allow the value's own dimension next to it, and nothing else: "north region", "supplier acme"
+        for phrase_value, (col, value) in self.values.items():
+            if phrase_value and f" {phrase_value} " in f" {phrase} ":
+                rest = f" {phrase} ".replace(f" {phrase_value} ", " ", 1).strip()
+                if self.names(rest, col):
+                    return col, value
+        return None
+
+    def dimension(self, phrase: str):
+        """Dimension `phrase` names exactly ("region", "each region", "all regions"), or None"""
+        phrase = normalize(re.sub(r"^(?:the|each|every|all)\s+", "", phrase.strip()))
+        col = self.phrases.get(phrase)
+        if col in self.dimensions:
+            return col
+        return next((col for col in NORMALIZED_SYNONYMS.get(phrase, ()) if col in self.dimensions), None)
+
+    def names(self, phrase: str, col: str) -> bool:
+        """Whether normalized `phrase` is exactly a name of `col` (or a synonym for it)"""
+        return phrase in column_phrases(col) or col in NORMALIZED_SYNONYMS.get(phrase, ())
+
+
+_schemas = {}  # id(df) -> Schema
+_lock = threading.Lock()
+
+
+def schema_for(df: pd.DataFrame) -> Schema:
+    key = id(df)
+    with _lock:
+        schema = _schemas.get(key)
+    if schema is None:
+        schema = Schema(df)
+        with _lock:
+            if key not in _schemas:
+                _schemas[key] = schema
+                weakref.finalize(df, _schemas.pop, key, None)
+            schema = _schemas[key]
+    return schema
+
+
+def default_aggregation(column: str) -> str:
+    return "mean" if AVERAGED.search(normalize(column)) else "sum"
+
+
+def split_aggregation(phrase: str):
+    """('mean', 'roi') for 'average roi'; (None, phrase) when no aggregation word leads"""
+    match = re.match(rf"^(?:the\s+)?({_AGG})\s+(.+)$", phrase)
+    if match:
+        return AGGREGATIONS[match.group(1)], match.group(2)
+    return None, phrase
+
+
+def describe(agg: str, column: str, capital: bool = False) -> str:
+    """'average ROI (%)'; the label is left out when the column already says it ('Total Cost')"""
+    label = AGGREGATION_LABELS.get(agg, agg)
+    text = column if normalize(column).startswith(label) else f"{label} {column}"
+    return text[0].upper() + text[1:] if capital else text
+
+
+def scalar(value):
+    return value.item() if hasattr(value, "item") else value
+
+
+def grouped(df, dim, measure, agg):
+    return df.groupby(dim, observed=True)[measure].agg(agg)
+
+
+def answer_top_n(df, schema, match):
+    ascending = match["direction"] in ("bottom", "worst", "lowest")
+    n = int(match["n"] or DEFAULT_TOP_N)
+    agg, measure_phrase = split_aggregation(match["measure"])
+    measure = schema.resolve(measure_phrase, schema.measures)
+    if measure is None or n <= 0:
+        return None
+    word = "bottom" if ascending else "top"
+    if normalize(match["dim"]) in ROW_WORDS and agg is None:
+        columns = schema.dimensions[:3] + [measure]
+        rows = df.nsmallest(n, measure) if ascending else df.nlargest(n, measure)
+        return f"The {word} {n} rows by {measure}.", rows[columns]
+    dim = schema.resolve(match["dim"], schema.dimensions)
+    if dim is None:
+        return None
+    agg = agg or default_aggregation(measure)
+    values = grouped(df, dim, measure, agg)
+    values = values.nsmallest(n) if ascending else values.nlargest(n)
+    return f"The {word} {len(values)} {dim} values by {describe(agg, measure)}.", values.reset_index()
+
+
+def answer_extreme(df, schema, match):
+    lowest = match["direction"] in ("lowest", "least", "worst", "smallest", "minimum")
+    dim = schema.resolve(match["dim"], schema.dimensions)
+    agg, measure_phrase = split_aggregation(match["measure"])
+    measure = schema.resolve(measure_phrase, schema.measures)
+    if dim is None or measure is None:
+        return None
+    agg = agg or default_aggregation(measure)
+    values = grouped(df, dim, measure, agg)
+    if values.empty:
+        return None
+    label = values.idxmin() if lowest else values.idxmax()
+    answer = (
+        f"{label} has the {'lowest' if lowest else 'highest'} {describe(agg, measure)} "
+        f"({scalar(values[label]):,.2f})."
+    )
+    return answer, values.loc[[label]].reset_index()
+
+
+def answer_group_by(df, schema, match):
+    agg = AGGREGATIONS[match["agg"]]
+    dim = schema.resolve(match["dim"], schema.dimensions)
+    if dim is None:
+        return None
+    if agg == "count":
+        values = df.groupby(dim, observed=True).size().rename("count").sort_values(ascending=False)
+        return f"Number of rows by {dim}.", values.reset_index()
+    measure = schema.resolve(match["measure"], schema.measures)
+    if measure is None:
+        return None
+    values = grouped(df, dim, measure, agg).sort_values(ascending=False)
+    return f"{describe(agg, measure, capital=True)} by {dim}.", values.reset_index()
+
+
+def answer_filtered(df, schema, match):
+    found = schema.value(match["value"])
+    if found is None:
+        # "average roi for each region" is a group-by with the dimension named after "for";
+        # anything less exact ("for warehouse 7") names a value we do not have
+        dim = schema.dimension(match["value"])
+        if dim is not None:
+            return answer_group_by(df, schema, {**match, "dim": dim})
+        return None
+    col, value = found
+    subset = df[df[col] == value]
+    agg = AGGREGATIONS[match["agg"]]
+    if agg == "count":
+        return f"Number of rows where {col} is {value}: {len(subset):,}.", len(subset)
+    measure = schema.resolve(match["measure"], schema.measures)
+    if measure is None:
+        return None
+    result = scalar(subset[measure].agg(agg))
+    return f"{describe(agg, measure, capital=True)} for {col} {value}: {result:,.2f}.", result
+
+
+def answer_overall(df, schema, match):
+    agg = AGGREGATIONS[match["agg"]]
+    if agg == "count":
+        return None
+    measure = schema.resolve(match["measure"], schema.measures)
+    if measure is None:
+        return None
+    result = scalar(df[measure].agg(agg))
+    return f"{describe(agg, measure, capital=True)}: {result:,.2f}.", result
+
+
+ANSWERS = {
+    "top_n": answer_top_n,
+    "extreme": answer_extreme,
+    "group_by": answer_group_by,
+    "filtered": answer_filtered,
+    "overall": answer_overall,
+}
+
+
+def clean_question(question: str) -> str:
+    question = question.strip().lower().rstrip("?.! ")
+    question = re.sub(r"\s+", " ", question)
+    return FILLER.sub("", question)
+
+
+def unsupported(question: str, groups: dict) -> bool:
+    """Whether the question says more than the matched template can answer
+
+    e.g. "total revenue for non north regions", "... by business unit and region" or
+    "total revenue from the top 3 products": answering the template would drop the qualifier.
+    """
+    if COMPOUND.search(question):
+        return True
+    if len(GROUPING.findall(question)) > 1:
+        return True
+    used = sum(1 for value in groups.values() if value and QUALIFIER.fullmatch(value))
+    return len(QUALIFIER.findall(question)) > used
+
+
+def answer_question(df: pd.DataFrame, question: str):
+    """{"intent", "answer", "result"} for a question a template answers, else None"""
+    question = clean_question(question)
+    schema = schema_for(df)
+    for name, pattern in TEMPLATES:
+        match = pattern.match(question)
+        if match is None:
+            continue
+        if unsupported(question, match.groupdict()):
+            logger.info(f"Intent '{name}' matched '{question}' but not all of it; leaving it to the LLM")
+            return None
+        try:
+            answered = ANSWERS[name](df, schema, match.groupdict())
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Intent '{name}' failed on '{question}': {e}")
+            answered = None
+        if answered is not None:
+            answer, result = answered
+            return {"intent": name, "answer": answer, "result": shape_result(result)}
+    return None
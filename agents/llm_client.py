@@ -0,0 +1,344 @@
+# agents/llm_client.py
+# Shared Ollama clients and the concurrency limits around every model call
+#
+# Each OllamaLLM owns a pooled HTTP client (sync and async), so agents share one instance
+# per model instead of opening a connection pool each. Calls to a model are capped by a
+# per-model limit and whole queries by a per-agent limit; both record queue depth and
+# wait times for /query/metrics, next to the prompt tokens and prefill time Ollama reports.
+#
+# The secondary stages (format repair, code repair) run through model tiers: a small model
+# first, escalating to the next one only when its output fails the stage's validation.
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_ollama import OllamaLLM
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL")
+# How long Ollama keeps a model (and the KV cache of its last prompt) loaded between calls
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Concurrent requests per model; OLLAMA_MODEL_LIMITS overrides it per model ("mistral=2,llama3=4")
+OLLAMA_MODEL_CONCURRENCY = int(os.getenv("OLLAMA_MODEL_CONCURRENCY", "2"))
+OLLAMA_MODEL_LIMITS = {
+    name.strip(): int(limit)
+    for name, _, limit in (item.partition("=") for item in os.getenv("OLLAMA_MODEL_LIMITS", "").split(","))
+    if name.strip() and limit
+}
+# Models tried in order for the secondary stages, smallest first
+MODEL_TIERS = {
+    "format": os.getenv("FORMAT_MODELS", "qwen2.5:1.5b,mistral"),
+    "code_fix": os.getenv("CODE_FIX_MODELS", "qwen2.5-coder:1.5b,mistral"),
+}
+# A tier whose model is not pulled on the server is skipped for this long
+MODEL_RETRY_AFTER = float(os.getenv("MODEL_RETRY_AFTER", "300"))
+# Queries each agent runs at once, and how many may wait before requests are turned away
+QUERY_AGENT_CONCURRENCY = int(os.getenv("QUERY_AGENT_CONCURRENCY", "3"))
+QUERY_AGENT_QUEUE = int(os.getenv("QUERY_AGENT_QUEUE", "16"))
+
+
+class QueueFull(Exception):
+    pass
+
+
+class _LimitStats:
+    def __init__(self, limit, max_waiting=None):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _enter_queue(self):
+        with self._stats_lock:
+            if self.max_waiting is not None and self.waiting >= self.max_waiting:
+                self.rejected += 1
+                raise QueueFull(f"{self.waiting} requests already waiting")
+            self.waiting += 1
+
+    def _acquired(self, waited):
+        with self._stats_lock:
+            self.waiting -= 1
+            self.in_flight += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def _abandoned(self):
+        with self._stats_lock:
+            self.waiting -= 1
+
+    def _released(self):
+        with self._stats_lock:
+            self.in_flight -= 1
+            self.completed += 1
+
+    def stats(self):
+        with self._stats_lock:
+            started = self.completed + self.in_flight
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "queue_depth": self.waiting,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_s": round(self.wait_total / started, 4) if started else 0.0,
+                "max_wait_s": round(self.wait_max, 4),
+            }
+
+
+class ConcurrencyLimit(_LimitStats):
+    """Blocking limit for code running on worker threads"""
+
+    def __init__(self, limit, max_waiting=None):
+        super().__init__(limit, max_waiting)
+        self._sem = threading.BoundedSemaphore(limit)
+
+    @contextmanager
+    def hold(self):
+        self._enter_queue()
+        start = time.monotonic()
+        try:
+            self._sem.acquire()
+        except BaseException:
+            self._abandoned()
+            raise
+        self._acquired(time.monotonic() - start)
+        try:
+            yield
+        finally:
+            self._sem.release()
+            self._released()
+
+
+class AsyncConcurrencyLimit(_LimitStats):
+    """Limit awaited on the event loop, so queued requests do not hold a thread"""
+
+    def __init__(self, limit, max_waiting=None):
+        super().__init__(limit, max_waiting)
+        self._sem = asyncio.Semaphore(limit)
+
+    async def acquire(self):
+        """Take a slot; give it back with release(), on the event loop"""
+        self._enter_queue()
+        start = time.monotonic()
+        try:
+            await self._sem.acquire()
+        except BaseException:
+            self._abandoned()
+            raise
+        self._acquired(time.monotonic() - start)
+
+    def release(self):
+        self._sem.release()
+        self._released()
+
+    @asynccontextmanager
+    async def hold(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class PromptStats(BaseCallbackHandler):
+    """Prompt tokens Ollama evaluated and the time it spent on them (prefill), per prompt
+
+    Ollama skips the part of a prompt that matches the KV cache of the model's previous
+    prompt, so with a stable prefix `prompt_tokens` drops to roughly the question itself.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.prefill_s = 0.0
+        self.last = None
+        self._stats_lock = threading.Lock()
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                info = generation.generation_info or {}
+                if "prompt_eval_count" not in info:
+                    continue
+                tokens = info["prompt_eval_count"]
+                prefill = info.get("prompt_eval_duration", 0) / 1e9
+                with self._stats_lock:
+                    self.calls += 1
+                    self.prompt_tokens += tokens
+                    self.prefill_s += prefill
+                    self.last = {"prompt_tokens": tokens, "prefill_s": round(prefill, 4)}
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "calls": self.calls,
+                "avg_prompt_tokens": round(self.prompt_tokens / self.calls, 1) if self.calls else 0.0,
+                "avg_prefill_s": round(self.prefill_s / self.calls, 4) if self.calls else 0.0,
+                "last": self.last,
+            }
+
+
+class TierStats:
+    """Outcome and latency of one model within a stage's tiers"""
+
+    def __init__(self):
+        self.calls = 0
+        self.accepted = 0
+        self.errors = 0
+        self.latency_total = 0.0
+        self._stats_lock = threading.Lock()
+
+    def record(self, latency, accepted, error=False):
+        with self._stats_lock:
+            self.calls += 1
+            self.accepted += accepted
+            self.errors += error
+            self.latency_total += latency
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "calls": self.calls,
+                "accepted": self.accepted,
+                "rejected": self.calls - self.accepted - self.errors,
+                "errors": self.errors,
+                "success_rate": round(self.accepted / self.calls, 3) if self.calls else 0.0,
+                "avg_latency_s": round(self.latency_total / self.calls, 4) if self.calls else 0.0,
+            }
+
+
+_llms = {}
+_model_limits = {}
+_agent_limits = {}
+_prompt_stats = {}
+_tier_stats = {}  # (stage, model) -> TierStats
+_unavailable = {}  # model -> monotonic time after which it is tried again
+_lock = threading.Lock()
+
+
+def get_llm(model: str, temperature: float = 0) -> OllamaLLM:
+    """Shared OllamaLLM (and so shared HTTP connection pools) for `model`"""
+    with _lock:
+        key = (model, temperature)
+        if key not in _llms:
+            kwargs = {"base_url": OLLAMA_BASE_URL} if OLLAMA_BASE_URL else {}
+            _llms[key] = OllamaLLM(model=model, temperature=temperature, keep_alive=OLLAMA_KEEP_ALIVE, **kwargs)
+        return _llms[key]
+
+
+def model_limit(model: str) -> ConcurrencyLimit:
+    with _lock:
+        if model not in _model_limits:
+            _model_limits[model] = ConcurrencyLimit(OLLAMA_MODEL_LIMITS.get(model, OLLAMA_MODEL_CONCURRENCY))
+        return _model_limits[model]
+
+
+def agent_limit(agent: str) -> AsyncConcurrencyLimit:
+    with _lock:
+        if agent not in _agent_limits:
+            _agent_limits[agent] = AsyncConcurrencyLimit(QUERY_AGENT_CONCURRENCY, QUERY_AGENT_QUEUE)
+        return _agent_limits[agent]
+
+
+def prompt_stats(prompt: str) -> PromptStats:
+    with _lock:
+        if prompt not in _prompt_stats:
+            _prompt_stats[prompt] = PromptStats()
+        return _prompt_stats[prompt]
+
+
+def invoke_llm(chain, inputs: dict, model: str, prompt: str = None) -> str:
+    """chain.invoke under the model's concurrency limit, recording prefill under `prompt`"""
+    config = {"callbacks": [prompt_stats(prompt or model)]}
+    with model_limit(model).hold():
+        return chain.invoke(inputs, config=config)
+
+
+def stream_llm(chain, inputs: dict, model: str, prompt: str = None):
+    """chain.stream under the model's concurrency limit; the slot is held until the stream ends"""
+    config = {"callbacks": [prompt_stats(prompt or model)]}
+    with model_limit(model).hold():
+        yield from chain.stream(inputs, config=config)
+
+
+def stage_models(stage: str) -> list:
+    return [model.strip() for model in MODEL_TIERS[stage].split(",") if model.strip()]
+
+
+def tier_stats(stage: str, model: str) -> TierStats:
+    with _lock:
+        key = (stage, model)
+        if key not in _tier_stats:
+            _tier_stats[key] = TierStats()
+        return _tier_stats[key]
+
+
+def _available(model: str) -> bool:
+    with _lock:
+        retry_at = _unavailable.get(model)
+        if retry_at is not None and time.monotonic() >= retry_at:
+            del _unavailable[model]
+            retry_at = None
+    return retry_at is None
+
+
+def run_tiers(stage: str, attempt, accept):
+    """attempt(model) for each of the stage's models in turn until accept(output) holds
+
+    Returns the first accepted output, otherwise the last one produced (None if every
+    model raised). The last tier is always tried, even if it was marked unavailable.
+    """
+    models = stage_models(stage)
+    output = None
+    for position, model in enumerate(models):
+        last = position == len(models) - 1
+        if not last and not _available(model):
+            continue
+        stats = tier_stats(stage, model)
+        start = time.monotonic()
+        try:
+            output = attempt(model)
+        except Exception as e:
+            stats.record(time.monotonic() - start, accepted=False, error=True)
+            if getattr(e, "status_code", None) == 404:
+                logger.warning(f"Model {model} is not available for {stage}; skipping it for {MODEL_RETRY_AFTER:.0f}s")
+                with _lock:
+                    _unavailable[model] = time.monotonic() + MODEL_RETRY_AFTER
+            else:
+                logger.error(f"{stage} with {model} failed: {e}")
+            continue
+        accepted = bool(accept(output))
+        stats.record(time.monotonic() - start, accepted)
+        if accepted:
+            return output
+        if not last:
+            logger.info(f"{stage} output from {model} failed validation; escalating")
+    return output
+
+
+def limit_stats() -> dict:
+    with _lock:
+        models = dict(_model_limits)
+        agents = dict(_agent_limits)
+        prompts = dict(_prompt_stats)
+        tiers = dict(_tier_stats)
+    stages = {}
+    for (stage, model), stats in tiers.items():
+        stages.setdefault(stage, {})[model] = stats.stats()
+    return {
+        "models": {name: limit.stats() for name, limit in models.items()},
+        "agents": {name: limit.stats() for name, limit in agents.items()},
+        "prompts": {name: stats.stats() for name, stats in prompts.items()},
+        "tiers": stages,
+    }
@@ -5,27 +5,30 @@ import ast
 import logging
 from difflib import get_close_matches
 
-from langchain_ollama import OllamaLLM
 from langchain.prompts import PromptTemplate
 from langchain_core.runnables import RunnableSequence
 
 from agents.format_agent import fix_llm_output
 from agents.code_fixer_agent import fix_invalid_code
+from agents.llm_client import get_llm, invoke_llm, stream_llm
+from agents.query_metrics import count
+from agents.sandbox_pool import sandbox_pool
+from agents.intent_engine import answer_question
+from agents.schema_context import schema_context
+from agents.answer_cache import answer_cache, answer_key, code_key, schema_signature
+from registry.dataset_registry import registry
+from registry.kpi_aggregates import FrameAggregates
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load datasets
-df_warehouse = pd.read_csv("data/warehouse_dataset.csv")
-df_store = pd.read_csv("data/store_manager_dataset.csv")
-df_exec = pd.read_csv("data/executive_insights_dataset.csv")
+# Model that writes the query code
+llm = get_llm("mistral")
 
-# Setup DeepSeek-R1 LLM
-llm = OllamaLLM(model="mistral", temperature=0)
-
-# Strict Prompt
+# Strict Prompt. Everything above the question is fixed per dataset version, so keep any
+# per-request text at the end where it does not invalidate Ollama's cached prefix.
 df_prompt = PromptTemplate(
-    input_variables=["question", "columns"],
+    input_variables=["question", "schema", "aggregates"],
     template="""
 You are a helpful and accurate Python data analyst working with a Pandas DataFrame called `df`.
 
@@ -49,8 +52,11 @@ Return only a JSON object with the following keys:
   "code": "<valid Python code that assigns result to a variable named `result`>"
 }}
 
-## Example columns:
-{columns}
+## Columns (dtype, then value range or example values):
+{schema}
+
+## Precomputed aggregates:
+`kpi['<name>']` returns a ready-made summary DataFrame. Prefer it over recomputing the same groupby. Available names: {aggregates}
 
 ## User question:
 {question}
@@ -95,86 +101,117 @@ def suggest_column_fixes(df, code):
 
 
 def run_llm_query(df: pd.DataFrame, question: str, agent_name: str):
+    return final_result(llm_query_events(df, question, agent_name))
+
+
+def final_result(events):
+    for event, data in events:
+        if event == "result":
+            return data
+
+
+def llm_query_events(df: pd.DataFrame, question: str, agent_name: str, stream: bool = False):
+    """The LLM query pipeline as (event, data) pairs, ending with ("result", result)
+
+    With stream=True the model output is also yielded token by token as ("token", text).
+    """
     try:
         logger.info(f"Processing query with {agent_name}: {question}")
 
-        llm_output = df_chain.invoke({
+        aggregates = FrameAggregates(df)
+        count("llm.generate")
+        schema, aggregate_names = schema_context(df)
+        inputs = {
             "question": question,
-            "columns": ", ".join(f"'{col}'" for col in df.columns)
-        }).strip()
+            "schema": schema,
+            "aggregates": aggregate_names
+        }
+        if stream:
+            chunks = []
+            for chunk in stream_llm(df_chain, inputs, llm.model, prompt="query"):
+                chunks.append(chunk)
+                yield "token", chunk
+            llm_output = "".join(chunks).strip()
+        else:
+            llm_output = invoke_llm(df_chain, inputs, llm.model, prompt="query").strip()
 
         logger.info(f"LLM raw output:\n{llm_output}")
 
         parsed = fix_llm_output(llm_output)
         if "error" in parsed:
-            return {
+            yield "result", {
                 "response": f"❌ Format Agent failed.\n\nRaw output:\n{llm_output}",
                 "status": "error",
                 "agent_used": agent_name
             }
+            return
 
         answer_text = parsed.get("answer", "").strip()
         code = parsed.get("code", "").strip()
+        yield "parsed", {"answer": answer_text, "code": code}
 
         if not code or "result" not in code or not is_valid_python(code):
             logger.warning("🔁 Attempting to fix invalid code with LLM...")
+            count("code_fix.llm")
             code = fix_invalid_code(code)
+            yield "code_fixed", {"code": code}
 
         if not code or "result" not in code or not is_valid_python(code):
-            return {
+            yield "result", {
                 "response": "❌ Even after code fix, the code is invalid or doesn't assign to `result`.",
                 "status": "error",
                 "agent_used": agent_name
             }
+            return
 
         if not validate_columns_exist(df, code):
             suggestions = suggest_column_fixes(df, code)
-            return {
+            yield "result", {
                 "response": f"❌ LLM referred to invalid columns: {columns_used_in_code(code)}. Suggestions: {suggestions}",
                 "status": "error",
                 "agent_used": agent_name
             }
+            return
 
         if "calculate_performance" in code:
-            return {
+            yield "result", {
                 "response": "❌ Hallucinated function `calculate_performance()` detected.",
                 "status": "error",
                 "agent_used": agent_name
             }
+            return
 
         logger.info(f"Extracted & validated code:\n{code}")
         code = validate_and_fix_code(code)
 
-        safe_globals = {
-            'pd': pd,
-            'df': df.copy(),
-            '__builtins__': {
-                'len': len, 'str': str, 'int': int, 'float': float, 'list': list, 'dict': dict,
-                'sum': sum, 'min': min, 'max': max, 'round': round, 'abs': abs, 'range': range,
-                'enumerate': enumerate, 'zip': zip, 'sorted': sorted, 'reversed': reversed
-            }
+        result = run_query_code(df, answer_text, code, agent_name, aggregates)
+        yield "executed", {"status": result["status"]}
+        if result["status"] == "success":
+            # Picked up by agent_events for the code cache; not part of the API response
+            result["code"] = code
+        yield "result", result
+
+    except Exception as e:
+        logger.error(f"❌ Error in {agent_name}: {str(e)}")
+        yield "result", {
+            "response": f"❌ Error during execution: {str(e)}",
+            "status": "error",
+            "agent_used": agent_name
         }
-        local_vars = {}
 
-        exec(code, safe_globals, local_vars)
-        result = local_vars.get("result")
 
-        if result is None:
+def run_query_code(df: pd.DataFrame, answer_text: str, code: str, agent_name: str, aggregates=None):
+    """Execute validated query code against `df` and shape the result for the API"""
+    try:
+        result_data = sandbox_pool.run(code, df, aggregates)
+
+        if result_data is None:
             return {
                 "response": "⚠️ Code ran, but no variable named `result` was found.",
                 "status": "error",
                 "agent_used": agent_name
             }
 
-        if isinstance(result, pd.DataFrame):
-            result_data = result.head(10).to_dict(orient="records")
-        elif isinstance(result, pd.Series):
-            result_data = result.to_dict()
-        elif isinstance(result, (list, dict, str, int, float)):
-            result_data = result
-        else:
-            result_data = str(result)
-
         return {
             "response": {
                 "answer": answer_text,
@@ -194,6 +231,18 @@ def run_llm_query(df: pd.DataFrame, question: str, agent_name: str):
 
 
 def run_simple_query(df: pd.DataFrame, question: str, agent_name: str):
+    """Answer common question shapes with the intent engine; an error result when none match"""
+    answered = answer_question(df, question)
+    if answered is not None:
+        logger.info(f"Intent '{answered['intent']}' answered for {agent_name}: {question}")
+        return {
+            "response": {
+                "answer": answered["answer"],
+                "result": answered["result"]
+            },
+            "status": "success",
+            "agent_used": agent_name + "_simple"
+        }
     return {
         "response": "Unable to understand your question clearly. Please rephrase it.",
         "status": "error",
@@ -201,22 +250,100 @@ def run_simple_query(df: pd.DataFrame, question: str, agent_name: str):
     }
 
 
-def warehouse_agent(question: str):
-    result = run_llm_query(df_warehouse, question, "WarehouseAgent")
-    if result["status"] == "error":
-        result = run_simple_query(df_warehouse, question, "WarehouseAgent")
+def run_cached_code(df: pd.DataFrame, question: str, agent_name: str, key: str):
+    """Re-run the code generated earlier for this question against the current data, if any"""
+    entry = answer_cache.get_code(key)
+    if entry is None:
+        return None
+    if not validate_columns_exist(df, entry["code"]):
+        answer_cache.drop_code(key)
+        return None
+    result = run_query_code(df, entry["answer"], entry["code"], agent_name)
+    if result["status"] != "success":
+        # The code no longer works on this data; ask the LLM again
+        logger.warning(f"Cached code for '{question}' failed, regenerating: {result['response']}")
+        answer_cache.drop_code(key)
+        return None
+    logger.info(f"Code cache hit for {agent_name}: {question}")
+    count("code_cache.hit")
     return result
 
 
-def store_agent(question: str):
-    result = run_llm_query(df_store, question, "StoreAgent")
+def request_key(dataset: str, question: str, agent_name: str) -> str:
+    """Identity of a query for coalescing: agent, normalised question, schema and data version"""
+    snapshot = registry.get(dataset)
+    return answer_key(agent_name, question, schema_signature(snapshot.df), snapshot.version)
+
+
+def quick_answer(dataset: str, question: str, agent_name: str):
+    """Intent engine or answer cache result for a question, without the LLM; None on a miss"""
+    snapshot = registry.get(dataset)
+    simple = run_simple_query(snapshot.df, question, agent_name)
+    if simple["status"] == "success":
+        count("intent.hit")
+        return simple
+    cached = answer_cache.get(answer_key(agent_name, question, schema_signature(snapshot.df), snapshot.version))
+    if cached is not None:
+        count("answer_cache.hit")
+    return cached
+
+
+def run_agent(dataset: str, question: str, agent_name: str):
+    return final_result(agent_events(dataset, question, agent_name))
+
+
+def agent_events(dataset: str, question: str, agent_name: str, stream: bool = False):
+    """Intent engine, caches, then the LLM pipeline, as (event, data) pairs ending with ("result", result)"""
+    snapshot = registry.get(dataset)
+    df = snapshot.df
+
+    # Template questions are answered in milliseconds; no need to cache them
+    simple = run_simple_query(df, question, agent_name)
+    if simple["status"] == "success":
+        count("intent.hit")
+        yield "intent", {"answer": simple["response"]["answer"]}
+        yield "result", simple
+        return
+    count("intent.miss")
+
+    schema = schema_signature(df)
+    key = answer_key(agent_name, question, schema, snapshot.version)
+
+    cached = answer_cache.get(key)
+    if cached is not None:
+        logger.info(f"Answer cache hit for {agent_name}: {question}")
+        count("answer_cache.hit")
+        yield "cache", {"layer": "answer"}
+        yield "result", cached
+        return
+
+    # Generated code outlives data refreshes: same agent, question and columns
+    generated_key = code_key(agent_name, question, schema)
+    result = run_cached_code(df, question, agent_name, generated_key)
+    if result is not None:
+        yield "cache", {"layer": "code"}
+    else:
+        for event, data in llm_query_events(df, question, agent_name, stream):
+            if event == "result":
+                result = data
+            else:
+                yield event, data
+        if result["status"] == "success":
+            answer_cache.put_code(generated_key, agent_name, question, result["response"]["answer"], result.pop("code"))
     if result["status"] == "error":
-        result = run_simple_query(df_store, question, "StoreAgent")
-    return result
+        result = simple
+    if result["status"] == "success":
+        answer_cache.put(key, agent_name, question, result)
+    yield "result", result
+
+
+def warehouse_agent(question: str):
+    return run_agent("warehouse", question, "WarehouseAgent")
+
+
+def store_agent(question: str):
+    return run_agent("store", question, "StoreAgent")
 
 
 def exec_agent(question: str):
-    result = run_llm_query(df_exec, question, "ExecutiveAgent")
-    if result["status"] == "error":
-        result = run_simple_query(df_exec, question, "ExecutiveAgent")
-    return result
+    return run_agent("executive", question, "ExecutiveAgent")
@@ -0,0 +1,19 @@
+# agents/query_metrics.py
+# Process-wide counters for the query pipeline, exposed on /query/metrics
+
+import threading
+from collections import Counter
+
+_counters = Counter()
+_lock = threading.Lock()
+
+
+def count(stage: str, n: int = 1):
+    """Record that a pipeline path was taken, e.g. count("format.local")"""
+    with _lock:
+        _counters[stage] += n
+
+
+def snapshot() -> dict:
+    with _lock:
+        return dict(sorted(_counters.items()))
@@ -0,0 +1,162 @@
+# agents/sandbox.py
+# Execution environment for LLM-generated pandas code
+#
+# Generated code gets its own `df`, but with pandas copy-on-write that frame is a lazy
+# shallow copy of the shared registry frame: nothing is copied up front, and any write
+# (df['x'] = ..., df.loc[...] = ..., inplace=True) copies just the blocks it touches.
+# NumPy arrays taken from it (.values, .to_numpy()) are read-only views.
+#
+# Copy-on-write is only switched on while generated code runs (see copy_on_write()); the
+# rest of the API keeps pandas' default semantics.
+
+import argparse
+import os
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pandas as pd
+
+from registry.kpi_aggregates import FrameAggregates
+
+# Set to 0 to fall back to a deep df.copy() per query
+SANDBOX_COPY_ON_WRITE = os.getenv("SANDBOX_COPY_ON_WRITE", "1") == "1"
+
+_cow_lock = threading.Lock()
+_cow_runs = 0
+_cow_previous = None
+
+SAFE_BUILTINS = {
+    'len': len, 'str': str, 'int': int, 'float': float, 'list': list, 'dict': dict,
+    'sum': sum, 'min': min, 'max': max, 'round': round, 'abs': abs, 'range': range,
+    'enumerate': enumerate, 'zip': zip, 'sorted': sorted, 'reversed': reversed
+}
+
+
+@contextmanager
+def copy_on_write():
+    """pandas copy-on-write for the duration of a sandboxed run
+
+    pandas options are process-wide rather than per thread, so overlapping runs share one
+    activation: the first run switches it on and the last one to finish restores the
+    previous setting. A plain option_context would let one run switch it off under another
+    whose `df` is a shallow copy of the shared frame.
+    """
+    global _cow_runs, _cow_previous
+    if not SANDBOX_COPY_ON_WRITE:
+        yield
+        return
+    with _cow_lock:
+        if _cow_runs == 0:
+            _cow_previous = pd.get_option("mode.copy_on_write")
+            pd.set_option("mode.copy_on_write", True)
+        _cow_runs += 1
+    try:
+        yield
+    finally:
+        with _cow_lock:
+            _cow_runs -= 1
+            if _cow_runs == 0:
+                pd.set_option("mode.copy_on_write", _cow_previous)
+
+
+def sandbox_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """The `df` handed to generated code; never the shared frame itself"""
+    return df.copy(deep=not pd.options.mode.copy_on_write)
+
+
+def sandbox_globals(df: pd.DataFrame, aggregates=None) -> dict:
+    return {
+        'pd': pd,
+        'df': sandbox_frame(df),
+        'kpi': aggregates if aggregates is not None else FrameAggregates(df),
+        '__builtins__': dict(SAFE_BUILTINS)
+    }
+
+
+def execute(code: str, df: pd.DataFrame, aggregates=None):
+    """Run `code` against `df` and return the value it assigned to `result` (or None)"""
+    local_vars = {}
+    with copy_on_write():
+        exec(code, sandbox_globals(df, aggregates), local_vars)
+    return local_vars.get("result")
+
+
+def shape_result(result):
+    """The JSON-friendly form of `result` returned by the API (None stays None)"""
+    if result is None:
+        return None
+    if isinstance(result, pd.DataFrame):
+        return result.head(10).to_dict(orient="records")
+    if isinstance(result, pd.Series):
+        return result.to_dict()
+    if isinstance(result, (list, dict, str, int, float)):
+        return result
+    return str(result)
+
+
+def run_shaped(code: str, df: pd.DataFrame, aggregates=None):
+    # Shaped inside the same activation: `result` may still share memory with the shared frame
+    with copy_on_write():
+        return shape_result(execute(code, df, aggregates))
+
+
+# Typical generated code, including two queries that write to their frame
+BENCHMARK_QUERIES = [
+    "result = df.groupby('Region')['Revenue'].sum()",
+    "df['Margin'] = df['Net Profit'] / df['Revenue']\nresult = df.nlargest(5, 'Margin')[['Product Name', 'Margin']]",
+    "result = df[df['Risk Status'] == 'Critical']['Risk Score'].mean()",
+    "df.loc[df['ROI (%)'] < 0, 'ROI (%)'] = 0\nresult = df['ROI (%)'].mean()",
+    "result = df.sort_values('Net Profit', ascending=False).head(10)[['Product Name', 'Region', 'Net Profit']]",
+]
+
+
+def benchmark(rows: int, concurrency: int = 10, source_csv: str = "data/executive_insights_dataset.csv"):
+    """Peak memory and wall time of `concurrency` simultaneous sandboxed queries, deep copy vs CoW"""
+    import numpy as np
+
+    base = pd.read_csv(source_csv)
+    rng = np.random.default_rng(0)
+    df = base.iloc[rng.integers(0, len(base), rows)].reset_index(drop=True)
+    frame_mb = df.memory_usage(deep=True).sum() / 1e6
+    checksum = df['ROI (%)'].sum()
+    codes = [BENCHMARK_QUERIES[i % len(BENCHMARK_QUERIES)] for i in range(concurrency)]
+
+    print(f"Rows: {rows:,}  frame: {frame_mb:,.1f} MB  concurrent queries: {concurrency}")
+    for label, cow in (("df.copy()", False), ("copy-on-write", True)):
+        with pd.option_context("mode.copy_on_write", cow):
+            df = df.copy(deep=False)  # fresh references so both modes start alike
+            aggregates = FrameAggregates(df)
+            # Every query holds its frame at the same moment, as under concurrent load
+            barrier = threading.Barrier(concurrency)
+
+            def run(code):
+                safe_globals = sandbox_globals(df, aggregates)
+                barrier.wait()
+                local_vars = {}
+                exec(code, safe_globals, local_vars)
+                return local_vars.get("result")
+
+            tracemalloc.start()
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(run, codes))
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        intact = df['ROI (%)'].sum() == checksum
+        print(f"{label:14}: peak {peak / 1e6:9,.1f} MB  {elapsed:7.3f}s  shared frame unchanged: {intact}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sandbox memory benchmark: deep copy vs copy-on-write")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+    benchmark(args.rows, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+# agents/sandbox_pool.py
+# Pre-forked processes that run generated code away from the API process
+#
+# The API process never forks: it is threaded, and a fork could copy locks other threads
+# hold (logging, SQLite, the kpi cache, the allocator) along with its open sockets.
+# Instead a zygote is started with spawn; it loads the datasets and their aggregates once
+# and, having no other threads, forks every worker, so the workers share those pages
+# copy-on-write. The API hands the zygote one end of a pipe per worker and talks to the
+# worker directly over it.
+#
+# Each query runs under a wall-clock timeout, a CPU-seconds limit (RLIMIT_CPU) and a cap on
+# the private memory the worker has added; a worker that breaks a limit, crashes or hangs
+# is killed and a fresh one is forked in its place. Frames the zygote does not hold (a
+# snapshot that was replaced by a reload mid-query, or a frame not from the registry) are
+# sent to the worker with the code, so generated code never runs in the API process.
+
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from multiprocessing.connection import Connection
+from multiprocessing.reduction import recv_handle, send_handle
+
+from agents.sandbox import run_shaped
+from registry.dataset_registry import registry
+from registry.kpi_aggregates import materialize
+
+logger = logging.getLogger(__name__)
+
+# Worker processes; 0 runs generated code in the calling thread as before
+SANDBOX_PROCESSES = int(os.getenv("SANDBOX_PROCESSES", "2"))
+# Wall-clock seconds per query, including time spent waiting for a free worker
+SANDBOX_TIMEOUT = float(os.getenv("SANDBOX_TIMEOUT", "30"))
+# CPU seconds per query (enforced by the kernel through RLIMIT_CPU)
+SANDBOX_CPU_SECONDS = int(os.getenv("SANDBOX_CPU_SECONDS", "20"))
+# Private memory (USS) a worker may reach while running a query
+SANDBOX_MAX_MEMORY_MB = int(os.getenv("SANDBOX_MAX_MEMORY_MB", "2048"))
+# How often the parent checks a running query against the limits
+POLL_INTERVAL = 0.05
+# Seconds to wait for the zygote to load the datasets, and for its replies afterwards
+ZYGOTE_START_TIMEOUT = float(os.getenv("SANDBOX_ZYGOTE_START_TIMEOUT", "120"))
+ZYGOTE_REPLY_TIMEOUT = 30.0
+
+
+class SandboxError(Exception):
+    """A query broke a limit or took its worker down; the worker is replaced"""
+
+
+class QueryFailed(Exception):
+    """The generated code raised; the worker is fine and goes back to the pool"""
+
+
+def _set_cpu_limit(seconds):
+    import resource
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = int(usage.ru_utime + usage.ru_stime)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = used + seconds
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    # Past the soft limit the kernel sends SIGXCPU, whose default action ends the worker
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _detach_fds(keep):
+    """Point every inherited descriptor except `keep` (and stdio) at /dev/null
+
+    dup2 rather than close, so Python objects that still think they own a descriptor
+    cannot later close one that has been reused.
+    """
+    try:
+        fds = [int(name) for name in os.listdir("/proc/self/fd")]
+    except OSError:
+        fds = range(3, 1024)
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in fds:
+        if fd > 2 and fd != devnull and fd not in keep:
+            try:
+                os.dup2(devnull, fd)
+            except OSError:
+                pass
+    os.close(devnull)
+
+
+def _worker_main(conn, frames, cpu_seconds):
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if task is None:
+            return
+        kind, source, code = task
+        try:
+            # "dataset": a frame the zygote loaded; "frame": a frame sent with the code
+            frame = frames[source] if kind == "dataset" else source
+            _set_cpu_limit(cpu_seconds)
+            conn.send(("ok", run_shaped(code, frame)))
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+
+def _load_datasets():
+    """Current registry frames and versions, with their aggregates materialized"""
+    frames, versions = {}, {}
+    for name, path in registry.paths.items():
+        if not os.path.exists(path):
+            continue
+        snapshot = registry.get(name)
+        materialize(snapshot.df)
+        frames[name], versions[name] = snapshot.df, snapshot.version
+    return frames, versions
+
+
+def _reap(children):
+    for pid, returncode in list(children.items()):
+        if returncode is None:
+            try:
+                done, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                children[pid] = -1
+                continue
+            if done:
+                children[pid] = os.waitstatus_to_exitcode(status)
+
+
+def _zygote_main(control, cpu_seconds):
+    """Single-threaded process that forks the workers; serves spawn/reap/stop requests"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # A spawn request always checks the files, so new workers get the latest version
+    registry.check_interval = 0
+    frames, versions = _load_datasets()
+    control.send(("ready", versions))
+    children = {}  # pid -> exit code once reaped
+
+    while True:
+        if not control.poll(1.0):
+            _reap(children)
+            continue
+        try:
+            request = control.recv()
+        except EOFError:
+            break  # the API process is gone
+        if request is None:
+            break
+
+        if request[0] == "spawn":
+            fd = recv_handle(control)
+            try:
+                frames, versions = _load_datasets()
+            except Exception as e:
+                logger.error(f"Sandbox zygote could not reload the datasets, keeping the loaded ones: {e}")
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    _detach_fds({fd})
+                    _worker_main(Connection(fd), frames, cpu_seconds)
+                finally:
+                    os._exit(0)
+            os.close(fd)
+            children[pid] = None
+            control.send((pid, versions))
+
+        elif request[0] == "reap":
+            pid = request[1]
+            if children.get(pid) is None:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                try:
+                    _, status = os.waitpid(pid, 0)
+                    children[pid] = os.waitstatus_to_exitcode(status)
+                except ChildProcessError:
+                    children[pid] = -1
+            control.send(children.pop(pid, -1))
+
+    for pid, returncode in children.items():
+        if returncode is None:
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+
+
+def private_memory_mb(pid: int) -> float:
+    """Memory only this process holds (Private_Clean + Private_Dirty), excluding pages
+    still shared with the parent"""
+    total_kb = 0
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            if line.startswith(("Private_Clean:", "Private_Dirty:")):
+                total_kb += int(line.split()[1])
+    return total_kb / 1024
+
+
+class Zygote:
+    """API-side handle on the zygote process; requests are serialized over one pipe"""
+
+    def __init__(self, cpu_seconds):
+        ctx = multiprocessing.get_context("spawn")
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_zygote_main, args=(child_conn, cpu_seconds), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self._lock = threading.Lock()
+        if not self.conn.poll(ZYGOTE_START_TIMEOUT):
+            self.stop()
+            raise SandboxError("Sandbox zygote did not finish loading the datasets")
+        _, self.versions = self.conn.recv()
+
+    def alive(self):
+        return self.process.is_alive()
+
+    def _call(self, request, handle=None):
+        with self._lock:
+            try:
+                self.conn.send(request)
+                if handle is not None:
+                    send_handle(self.conn, handle, self.process.pid)
+                if not self.conn.poll(ZYGOTE_REPLY_TIMEOUT):
+                    raise SandboxError("Sandbox zygote is not responding")
+                return self.conn.recv()
+            except (EOFError, OSError) as e:
+                raise SandboxError(f"Sandbox zygote is gone: {e}")
+
+    def spawn(self):
+        conn, child_conn = multiprocessing.Pipe()
+        try:
+            pid, versions = self._call(("spawn",), child_conn.fileno())
+        except SandboxError:
+            conn.close()
+            raise
+        finally:
+            child_conn.close()
+        return SandboxWorker(pid, conn, versions)
+
+    def reap(self, pid):
+        """Kill worker `pid` if it still runs and return its exit code"""
+        return self._call(("reap", pid))
+
+    def stop(self):
+        with self._lock:
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(timeout=5)
+        self.conn.close()
+
+
+class SandboxWorker:
+    def __init__(self, pid, conn, versions):
+        self.pid = pid
+        self.conn = conn
+        self.versions = versions  # dataset -> version the worker was forked with
+
+    def holds(self, dataset, version):
+        return self.versions.get(dataset) == version
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.conn.close()
+
+
+class SandboxPool:
+    def __init__(
+        self,
+        size=SANDBOX_PROCESSES,
+        timeout=SANDBOX_TIMEOUT,
+        cpu_seconds=SANDBOX_CPU_SECONDS,
+        max_memory_mb=SANDBOX_MAX_MEMORY_MB,
+    ):
+        self.size = size
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.max_memory_mb = max_memory_mb
+        self._idle = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._zygote = None
+        self.enabled = False
+        self.replaced = 0
+        self.shipped = 0
+
+    def start(self):
+        """Start the zygote and its workers; call from the lifespan, before serving requests"""
+        if self.size <= 0:
+            return
+        if not hasattr(os, "fork"):
+            logger.warning("Sandbox pool needs fork; running generated code in-process")
+            return
+        self.enabled = True
+        for _ in range(self.size):
+            self._idle.put(self._spawn())
+        logger.info(f"Started {self.size} sandbox processes")
+
+    def shutdown(self):
+        with self._lock:
+            workers, self._workers = self._workers, []
+            zygote, self._zygote = self._zygote, None
+            self.enabled = False
+        self._idle = queue.Queue()
+        for worker in workers:
+            worker.stop()
+        if zygote is not None:
+            zygote.stop()
+
+    def _zygote_for_spawn(self):
+        with self._lock:
+            if not self.enabled:
+                raise SandboxError("Sandbox pool is shutting down")
+            if self._zygote is None or not self._zygote.alive():
+                if self._zygote is not None:
+                    logger.error("Sandbox zygote died; starting a new one")
+                    self._zygote.stop()
+                self._zygote = Zygote(self.cpu_seconds)
+            return self._zygote
+
+    def _spawn(self):
+        worker = self._zygote_for_spawn().spawn()
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def _replace(self, worker):
+        """Kill `worker` and fork a fresh one; returns (replacement or None, old exit code)"""
+        worker.conn.close()
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+            zygote = self._zygote
+        returncode = None
+        if zygote is not None:
+            try:
+                returncode = zygote.reap(worker.pid)
+            except SandboxError as e:
+                logger.error(f"Could not reap sandbox process {worker.pid}: {e}")
+        self.replaced += 1
+        try:
+            return self._spawn(), returncode
+        except SandboxError as e:
+            logger.error(f"Could not replace sandbox process: {e}")
+            return None, returncode
+
+    def _snapshot_of(self, df):
+        """(dataset, version) when `df` is a dataset's current frame, else (None, None)"""
+        for name in registry.versions():
+            snapshot = registry.get(name)
+            if snapshot.df is df:
+                return name, snapshot.version
+        return None, None
+
+    def run(self, code: str, df, aggregates=None):
+        """Shaped result of running `code` against `df`; raises SandboxError on limit breaches
+
+        With the pool disabled (SANDBOX_PROCESSES=0) the code runs in the calling thread.
+        """
+        if not self.enabled:
+            return run_shaped(code, df, aggregates)
+
+        dataset, version = self._snapshot_of(df)
+        deadline = time.monotonic() + self.timeout
+        try:
+            worker = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise SandboxError(f"No sandbox process became free within {self.timeout:.0f}s")
+
+        try:
+            # An idle worker never has anything to read, unless its pipe closed because it died
+            if worker.conn.poll() or (dataset is not None and not worker.holds(dataset, version)):
+                worker, _ = self._replace(worker)
+                if worker is None:
+                    raise SandboxError("No sandbox process is available")
+            if dataset is not None and worker.holds(dataset, version):
+                worker.conn.send(("dataset", dataset, code))
+            else:
+                # The zygote does not hold this frame; send it along
+                self.shipped += 1
+                worker.conn.send(("frame", df, code))
+            return self._wait(worker, deadline)
+        except SandboxError:
+            if worker is not None:
+                worker, _ = self._replace(worker)
+            raise
+        except (BrokenPipeError, EOFError, OSError):
+            worker, returncode = self._replace(worker)
+            raise SandboxError(self._death_reason(returncode))
+        finally:
+            if worker is not None:
+                self._idle.put(worker)
+
+    def _wait(self, worker, deadline):
+        while True:
+            if worker.conn.poll(POLL_INTERVAL):
+                # EOFError here means the worker died; run() replaces it and reports why
+                status, payload = worker.conn.recv()
+                break
+            if time.monotonic() > deadline:
+                raise SandboxError(f"Query exceeded the {self.timeout:.0f}s time limit")
+            try:
+                memory = private_memory_mb(worker.pid)
+            except OSError:
+                continue
+            if memory > self.max_memory_mb:
+                raise SandboxError(f"Query exceeded the {self.max_memory_mb} MB memory limit")
+
+        if status == "error":
+            raise QueryFailed(payload)
+        return payload
+
+    def _death_reason(self, returncode):
+        if returncode == -signal.SIGXCPU:
+            return f"Query was stopped after exceeding the {self.cpu_seconds}s CPU limit"
+        return f"Sandbox process died while running the query (exit code {returncode})"
+
+    def stats(self):
+        with self._lock:
+            processes = len(self._workers)
+            zygote = self._zygote is not None and self._zygote.alive()
+        return {
+            "processes": processes,
+            "idle": self._idle.qsize(),
+            "replaced": self.replaced,
+            "frames_sent": self.shipped,
+            "zygote": zygote,
+        }
+
+
+sandbox_pool = SandboxPool()
@@ -0,0 +1,170 @@
+# agents/schema_context.py
+# Dataset description for the query prompt, built once per dataset version
+#
+# The text only depends on the DataFrame, so every question against the same dataset
+# version gets a byte-identical prompt up to the question itself. Ollama can then reuse
+# the KV cache of that prefix instead of evaluating the instructions and schema again.
+
+import argparse
+import threading
+import time
+import weakref
+
+import pandas as pd
+
+from registry.kpi_aggregates import available
+
+# Example values listed for a categorical column
+EXAMPLE_VALUES = 5
+
+_cache = {}  # id(df) -> (schema, aggregates)
+_lock = threading.Lock()
+
+
+def _number(value) -> str:
+    return f"{value:g}" if isinstance(value, float) else str(value)
+
+
+def describe_column(name: str, series: pd.Series) -> str:
+    """One prompt line: quoted name, dtype, then the value range or a few example values"""
+    line = f"- '{name}' ({series.dtype})"
+    values = series.dropna()
+    if values.empty:
+        return f"{line}: empty"
+    if pd.api.types.is_bool_dtype(series):
+        return line
+    if pd.api.types.is_numeric_dtype(series):
+        line = f"{line}: {_number(values.min())} to {_number(values.max())}"
+        if values.is_unique:
+            line += ", unique"
+        return line
+    uniques = values.unique()
+    examples = ", ".join(repr(str(value)) for value in uniques[:EXAMPLE_VALUES])
+    more = f", ... ({len(uniques)} distinct)" if len(uniques) > EXAMPLE_VALUES else ""
+    return f"{line}: {examples}{more}"
+
+
+def build_context(df: pd.DataFrame):
+    schema = "\n".join(describe_column(col, df[col]) for col in df.columns)
+    aggregates = ", ".join(available(df)) or "none"
+    return schema, aggregates
+
+
+def schema_context(df: pd.DataFrame):
+    """(schema, aggregates) prompt text for `df`, computed on first use and kept while it lives"""
+    key = id(df)
+    with _lock:
+        context = _cache.get(key)
+    if context is None:
+        context = build_context(df)
+        with _lock:
+            if key not in _cache:
+                _cache[key] = context
+                weakref.finalize(df, _cache.pop, key, None)
+            context = _cache[key]
+    return context
+
+
+BENCHMARK_QUESTIONS = [
+    "Which products have a negative ROI in the South region?",
+    "How does automation savings compare with automation investment per business unit?",
+    "List the five warehouses with the highest carbon emission per order.",
+    "What share of revenue comes from critical-risk rows?",
+]
+
+# The query prompt as it was before the schema context: quoted column names only
+BASELINE_TEMPLATE = """
+You are a helpful and accurate Python data analyst working with a Pandas DataFrame called `df`.
+
+## Objective:
+Answer the user’s question **strictly using the columns provided below**. Do not use any functions or columns not listed.
+
+## Key Rules:
+- If the user uses vague or domain-specific terms (e.g. "inventory turnover", "delivery time"), map them **only** to existing columns if appropriate.
+- Never make up columns or functions. Use only what's in the provided list.
+- Use only valid Python syntax and built-in `pandas` or `numpy` functions.
+- The final output **must assign the answer to a variable named `result`**.
+- Do not use `print()`, `where`, `...`, or undefined variables.
+- Do not add commentary or explanation.
+- ⚠️ If the answer refers to a specific row (e.g. highest ROI), return that full row (or a few selected relevant columns) as a DataFrame.
+- Do not return only the computed metric — include associated columns (e.g., 'Product Name', 'Region', 'Warehouse ID') if available so that we can understand the results showcased.
+
+## Response Format:
+Return only a JSON object with the following keys:
+{{
+  "answer": "<brief summary in natural language>",
+  "code": "<valid Python code that assigns result to a variable named `result`>"
+}}
+
+## Example columns:
+{columns}
+
+## User question:
+{question}
+"""
+
+
+def benchmark_prompts(df: pd.DataFrame):
+    """{"baseline", "schema"} -> question -> rendered query prompt, old and current"""
+    from agents.ollama_agent import df_prompt
+
+    columns = ", ".join(f"'{col}'" for col in df.columns)
+    schema, aggregates = schema_context(df)
+    return {
+        "baseline": lambda question: BASELINE_TEMPLATE.format(question=question, columns=columns),
+        "schema": lambda question: df_prompt.format(question=question, schema=schema, aggregates=aggregates),
+    }
+
+
+def compare_prompts(df: pd.DataFrame, invoke, questions=BENCHMARK_QUESTIONS):
+    """question -> {prompt name -> PromptStats.last} for each benchmark prompt
+
+    `invoke(prompt, stats)` sends one rendered prompt to the model with `stats` as its
+    callback. Each prompt runs over all questions in turn so it is measured against its own
+    cached prefix, not the other prompt's.
+    """
+    from agents.llm_client import PromptStats
+
+    results = {question: {} for question in questions}
+    for name, render in benchmark_prompts(df).items():
+        for question in questions:
+            stats = PromptStats()
+            invoke(render(question), stats)
+            results[question][name] = {"chars": len(render(question)), **(stats.last or {})}
+    return results
+
+
+def benchmark(dataset: str = "executive"):
+    """Prompt tokens and prefill time Ollama reports per call, baseline prompt vs schema context
+
+    The first call of each prompt evaluates all of it; later ones reuse the cached prefix and
+    only evaluate what follows it. Needs a running Ollama server.
+    """
+    from agents.ollama_agent import llm
+    from registry.dataset_registry import registry
+
+    df = registry.frame(dataset)
+    start = time.perf_counter()
+    schema, _ = schema_context(df)
+    print(f"Schema context for {dataset}: {len(schema):,} characters, built in {time.perf_counter() - start:.3f}s")
+    results = compare_prompts(df, lambda prompt, stats: llm.invoke(prompt, config={"callbacks": [stats]}))
+    print(f"{'baseline':>26}  {'schema context':>26}")
+    print(f"{'chars':>8}{'tokens':>9}{'prefill':>9}  {'chars':>8}{'tokens':>9}{'prefill':>9}  question")
+    for question, runs in results.items():
+        cells = "  ".join(
+            f"{run['chars']:>8,}{run.get('prompt_tokens', '?'):>9}{run.get('prefill_s', 0):>8.3f}s"
+            for run in (runs["baseline"], runs["schema"])
+        )
+        print(f"{cells}  {question}")
+    print(f"Model: {llm.model}  keep_alive: {llm.keep_alive}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt prefill benchmark for the query prompt")
+    parser.add_argument("--dataset", default="executive", choices=["warehouse", "store", "executive"])
+    args = parser.parse_args()
+    benchmark(args.dataset)
+
+
+if __name__ == "__main__":
+    main()
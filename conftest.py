@@ -0,0 +1 @@
+# Makes the top-level packages (agents, registry, queries, ...) importable from tests/
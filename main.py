@@ -1,10 +1,39 @@
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from plots.plot_router import router as plot_router
+from plots.plot_router import router as plot_router, prewarm_plots
+from plots.plot_renderer import start_plot_pool, shutdown_plot_pool
 from reports.report_router import router as report_router
 from queries.query_router import router as query_router
+from registry.dataset_registry import registry
+from registry.kpi_aggregates import materialize
+from reports.report_generator import shutdown_render_pool
+from reports.report_jobs import report_jobs
+from agents.sandbox_pool import sandbox_pool
+from agents.schema_context import schema_context
 
-app = FastAPI(title="Supply Chain KPI API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Parse every dataset once up front so the first requests don't pay for it
+    registry.preload()
+    for name in registry.versions():
+        materialize(registry.frame(name))
+        schema_context(registry.frame(name))
+    # After preload, so the sandbox zygote finds up-to-date Arrow copies to load
+    sandbox_pool.start()
+    start_plot_pool()
+    if os.getenv("PLOT_PREWARM", "0") == "1":
+        prewarm_plots()
+    yield
+    report_jobs.shutdown()
+    shutdown_render_pool()
+    shutdown_plot_pool()
+    sandbox_pool.shutdown()
+
+
+app = FastAPI(title="Supply Chain KPI API", lifespan=lifespan)
 
 # Allow CORS
 app.add_middleware(
@@ -0,0 +1,55 @@
+# plots/plot_cache.py
+# Bounded in-memory LRU of encoded plot images
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+PLOT_CACHE_MAX_ITEMS = int(os.getenv("PLOT_CACHE_MAX_ITEMS", "256"))
+PLOT_CACHE_MAX_BYTES = int(os.getenv("PLOT_CACHE_MAX_MB", "64")) * 1024 * 1024
+
+
+class PlotCache:
+    def __init__(self, max_items=PLOT_CACHE_MAX_ITEMS, max_bytes=PLOT_CACHE_MAX_BYTES):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (content, media_type, etag)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, content: bytes, media_type: str):
+        entry = (content, media_type, plot_etag(key))
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[0])
+            self._entries[key] = entry
+            self._bytes += len(content)
+            while self._entries and (len(self._entries) > self.max_items or self._bytes > self.max_bytes):
+                _, (evicted, _, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+        return entry
+
+    def stats(self):
+        with self._lock:
+            return {"items": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+def plot_etag(key) -> str:
+    return '"' + hashlib.sha1(repr(key).encode()).hexdigest() + '"'
+
+
+plot_cache = PlotCache()
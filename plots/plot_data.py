@@ -0,0 +1,136 @@
+# plots/plot_data.py
+# Pre-aggregated series behind each role plot, for rendering in the browser
+#
+# Every plot reduces to a few dozen numbers (bin counts, quartiles, group means), so
+# these are computed with vectorised pandas/NumPy and returned as compact JSON.
+
+import math
+
+import numpy as np
+
+from registry.kpi_aggregates import kpi
+
+# Fine bins the binned KDE is estimated from
+KDE_BINS = 512
+# Points of the KDE curve returned to clients (every KDE_BINS // KDE_POINTS-th bin)
+KDE_POINTS = 128
+# Upper bound on histogram bins when numpy's "auto" rule asks for more
+HIST_MAX_BINS = 100
+# Cells per axis of the 2D histogram a scatter is reduced to
+SCATTER_BINS = 40
+
+
+def binned_kde(values, bins=KDE_BINS):
+    """Gaussian KDE of `values` on a fine histogram grid, as (x, density)
+
+    Same bandwidth as seaborn's default (Scott's rule), but the cost is a histogram
+    plus a convolution over `bins` points instead of one kernel per row.
+    """
+    values = values[np.isfinite(values)]
+    counts, edges = np.histogram(values, bins=bins)
+    centers = (edges[:-1] + edges[1:]) / 2
+    dx = edges[1] - edges[0]
+    bandwidth = values.std(ddof=1) * len(values) ** -0.2
+    if not dx or not bandwidth:
+        return centers, counts / max(len(values), 1)
+    half = int(np.ceil(4 * bandwidth / dx))
+    offsets = np.arange(-half, half + 1) * dx
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2)
+    kernel /= kernel.sum()
+    smoothed = np.convolve(counts, kernel)[half:half + len(counts)]
+    return centers, smoothed / (len(values) * dx)
+
+
+def _num(value):
+    value = float(value)
+    return float(f"{value:.6g}") if math.isfinite(value) else None
+
+
+def _nums(values):
+    return [_num(v) for v in values]
+
+
+def _labels(values):
+    return [v.item() if isinstance(v, np.generic) else v for v in values]
+
+
+def hist_series(df, col):
+    values = df[col].to_numpy(dtype=float)
+    values = values[np.isfinite(values)]
+    edges = np.histogram_bin_edges(values, bins="auto")
+    if len(edges) - 1 > HIST_MAX_BINS:
+        edges = np.histogram_bin_edges(values, bins=HIST_MAX_BINS)
+    counts, _ = np.histogram(values, bins=edges)
+    x, density = binned_kde(values)
+    step = KDE_BINS // KDE_POINTS
+    return {
+        "column": col,
+        "count": int(len(values)),
+        "bin_edges": _nums(edges),
+        "counts": counts.tolist(),
+        # Probability density; multiply by count * bin width to overlay on the bars
+        "kde": {"x": _nums(x[::step]), "density": _nums(density[::step])},
+    }
+
+
+def box_series(df, x, y):
+    data = df[[x, y]].dropna()
+    grouped = data.groupby(x)[y]
+    quartiles = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    q1, median, q3 = quartiles[0.25], quartiles[0.5], quartiles[0.75]
+    # Whiskers reach the most extreme values within 1.5 IQR, as in matplotlib/seaborn
+    iqr = q3 - q1
+    low = data[x].map(q1 - 1.5 * iqr)
+    high = data[x].map(q3 + 1.5 * iqr)
+    inside = data[y].between(low, high)
+    whiskers = data[inside].groupby(x)[y].agg(["min", "max"]).reindex(quartiles.index)
+    outliers = (~inside).groupby(data[x]).sum().reindex(quartiles.index, fill_value=0)
+    return {
+        "x": x,
+        "y": y,
+        "categories": _labels(quartiles.index),
+        "q1": _nums(q1),
+        "median": _nums(median),
+        "q3": _nums(q3),
+        "whisker_low": _nums(whiskers["min"]),
+        "whisker_high": _nums(whiskers["max"]),
+        "count": grouped.count().reindex(quartiles.index).tolist(),
+        "outliers": outliers.astype(int).tolist(),
+    }
+
+
+def scatter_series(df, x, y):
+    data = df[[x, y]].dropna()
+    counts, x_edges, y_edges = np.histogram2d(
+        data[x].to_numpy(dtype=float), data[y].to_numpy(dtype=float), bins=SCATTER_BINS
+    )
+    ix, iy = np.nonzero(counts)
+    return {
+        "x": x,
+        "y": y,
+        "count": int(len(data)),
+        "x_edges": _nums(x_edges),
+        "y_edges": _nums(y_edges),
+        # Sparse [x bin, y bin, rows] triples for the non-empty cells
+        "cells": np.column_stack([ix, iy, counts[ix, iy].astype(int)]).tolist(),
+    }
+
+
+def bar_series(df, aggregate, x, y):
+    agg = kpi(df, aggregate)
+    return {
+        "x": x,
+        "y": y,
+        "categories": _labels(agg[x]),
+        "mean": _nums(agg[y]),
+        "ci": _nums(agg["ci"]),
+        "count": agg["count"].astype(int).tolist(),
+    }
+
+
+# kind -> series(df, **params); mirrors DRAW in plots/plot_renderer.py
+SERIES = {"hist": hist_series, "box": box_series, "scatter": scatter_series, "bar": bar_series}
+
+
+def plot_series(df, kind: str, params: dict) -> dict:
+    return {"kind": kind, **SERIES[kind](df, **params)}
@@ -0,0 +1,228 @@
+# plots/plot_renderer.py
+# Plot definitions and the pool of renderer processes that draws them
+#
+# pyplot and seaborn keep global figure state, so drawing from Starlette's threadpool
+# can mix up figures under load. Every plot is drawn in a dedicated process instead;
+# each worker imports matplotlib/seaborn and loads the datasets once at start-up.
+
+import matplotlib
+matplotlib.use('Agg')
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+from registry.dataset_registry import registry
+from registry.kpi_aggregates import barplot_mean_ci, kpi, materialize
+from plots.plot_data import binned_kde
+
+logger = logging.getLogger(__name__)
+
+# Renderer processes; 0 draws inline, one plot at a time, in the API process
+PLOT_RENDER_WORKERS = int(os.getenv("PLOT_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Renders allowed to wait for a free worker before requests are turned away
+PLOT_RENDER_QUEUE = int(os.getenv("PLOT_RENDER_QUEUE", "32"))
+
+# Above this many rows plots switch to large-data mode unless ?exact=true is given:
+# scatters become hexbins, histogram KDEs are smoothed from binned counts and
+# boxplots skip the individual outlier markers
+PLOT_LARGE_ROWS = int(os.getenv("PLOT_LARGE_ROWS", "50000"))
+# Hexagons across the x axis of a large-data scatter
+PLOT_HEXBIN_GRIDSIZE = int(os.getenv("PLOT_HEXBIN_GRIDSIZE", "60"))
+
+
+def hist_kde(df, ax, large, col):
+    if not large:
+        return sns.histplot(df[col], kde=True, ax=ax)
+    sns.histplot(df[col], ax=ax)
+    x, density = binned_kde(df[col].to_numpy(dtype=float))
+    # Scale to the bar heights, as seaborn does for kde=True
+    binwidth = ax.patches[0].get_width() if ax.patches else 1
+    ax.plot(x, density * len(df) * binwidth)
+    return ax
+
+
+def scatter(df, ax, large, x, y):
+    if not large:
+        return sns.scatterplot(x=x, y=y, data=df, ax=ax)
+    hb = ax.hexbin(df[x], df[y], gridsize=PLOT_HEXBIN_GRIDSIZE, mincnt=1, bins="log", cmap="Blues")
+    ax.figure.colorbar(hb, ax=ax, label="rows (log)")
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    return ax
+
+
+def boxplot(df, ax, large, x, y):
+    return sns.boxplot(x=x, y=y, data=df, showfliers=not large, ax=ax)
+
+
+def bar(df, ax, large, aggregate, x, y):
+    return barplot_mean_ci(kpi(df, aggregate), x=x, y=y, ax=ax)
+
+
+# kind -> draw(df, ax, large, **params); plots/plot_data.py has the matching JSON series
+DRAW = {"hist": hist_kde, "box": boxplot, "scatter": scatter, "bar": bar}
+
+# role -> list of (dataset, kind, params); /plot/{role}/{index} picks index % len
+PLOTS = {
+    "warehouse ops manager": [
+        ("warehouse", "hist", {"col": "Inventory_Turnover"}),
+        ("warehouse", "box", {"x": "Shipping_Mode", "y": "Shipping_Date"}),
+        ("warehouse", "scatter", {"x": "Forecast_Accuracy_pct", "y": "Profit"}),
+        ("warehouse", "bar", {"aggregate": "total_sales_by_region", "x": "Order_Region", "y": "Total_Sales"}),
+    ],
+    "store manager": [
+        ("store", "bar", {"aggregate": "total_cost_by_supplier", "x": "Supplier Name", "y": "Total Cost"}),
+        ("store", "box", {"x": "On Time Delivery", "y": "Lead Time (Days)"}),
+        ("store", "hist", {"col": "Inventory Health Score"}),
+        ("store", "scatter", {"x": "Return Rate (%)", "y": "Damage Rate (%)"}),
+    ],
+    "executive": [
+        ("executive", "bar", {"aggregate": "net_profit_by_product", "x": "Product Name", "y": "Net Profit"}),
+        ("executive", "scatter", {"x": "ROI on Automation (%)", "y": "Automation Investment"}),
+        ("executive", "box", {"x": "Risk Status", "y": "Risk Score"}),
+        ("executive", "bar", {"aggregate": "carbon_emission_by_region", "x": "Region", "y": "Carbon Emission (kg)"}),
+    ],
+    # Even indexes show warehouse profit by shipping mode, odd ones store lead time vs cost
+    "supply chain manager": [
+        ("warehouse", "bar", {"aggregate": "profit_by_shipping_mode", "x": "Shipping_Mode", "y": "Profit"}),
+        ("store", "scatter", {"x": "Lead Time (Days)", "y": "Total Cost"}),
+    ],
+}
+
+# format -> media type
+MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml", "webp": "image/webp"}
+# Inclusive bounds for the size query parameters (pixels, dots per inch)
+WIDTH_RANGE = (160, 2400)
+HEIGHT_RANGE = (120, 1600)
+DPI_RANGE = (30, 300)
+
+# Render options that change the encoded bytes; part of every cache key.
+# width/height are pixels, so the figure is width/dpi x height/dpi inches.
+DEFAULT_OPTIONS = (("format", "png"), ("width", 800), ("height", 400), ("dpi", 100), ("exact", False))
+
+
+class RenderPoolBusy(Exception):
+    pass
+
+
+def fig_to_bytes(fig, fmt="png", dpi=100):
+    buf = BytesIO()
+    fig.tight_layout()
+    # WebP goes through Pillow, which matplotlib already depends on
+    fig.savefig(buf, format=fmt, dpi=dpi)
+    plt.close(fig)
+    return buf.getvalue()
+
+
+def draw_plot(role: str, slot: int, options=DEFAULT_OPTIONS):
+    """Draw one plot and return (content, media_type, dataset version it was drawn from)"""
+    dataset, kind, params = PLOTS[role][slot]
+    snapshot = registry.get(dataset)
+    options = dict(options)
+    large = not options["exact"] and len(snapshot.df) > PLOT_LARGE_ROWS
+    dpi = options["dpi"]
+    fig, ax = plt.subplots(figsize=(options["width"] / dpi, options["height"] / dpi), dpi=dpi)
+    try:
+        DRAW[kind](snapshot.df, ax, large, **params)
+    except Exception:
+        plt.close(fig)
+        raise
+    fmt = options["format"]
+    return fig_to_bytes(fig, fmt, dpi), MEDIA_TYPES[fmt], snapshot.version
+
+
+# ---------- Renderer pool ----------
+_pool = None
+_pool_lock = threading.Lock()
+_inline_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(max(PLOT_RENDER_WORKERS, 1) + PLOT_RENDER_QUEUE)
+
+
+def _init_worker():
+    # Same look as plots drawn in the API process, where report_generator sets it
+    sns.set(style="whitegrid")
+    registry.preload()
+    for name in registry.versions():
+        materialize(registry.frame(name))
+
+
+def _ready():
+    return os.getpid()
+
+
+def get_plot_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=PLOT_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return _pool
+
+
+def start_plot_pool():
+    """Start every renderer process now rather than on the first requests"""
+    if PLOT_RENDER_WORKERS <= 0:
+        return
+    pool = get_plot_pool()
+    # Each submit without an idle worker spawns another process, up to max_workers
+    for future in [pool.submit(_ready) for _ in range(PLOT_RENDER_WORKERS)]:
+        future.result()
+    logger.info(f"Plot renderer pool ready ({PLOT_RENDER_WORKERS} processes)")
+
+
+def shutdown_plot_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+def _reset_broken_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _draw_inline(role, slot, options):
+    with _inline_lock:
+        return draw_plot(role, slot, options)
+
+
+def render_plot_sync(role: str, slot: int, options=DEFAULT_OPTIONS):
+    """Blocking render through the pool (used for pre-warming)"""
+    if PLOT_RENDER_WORKERS <= 0:
+        return _draw_inline(role, slot, options)
+    return get_plot_pool().submit(draw_plot, role, slot, options).result()
+
+
+async def render_plot_async(role: str, slot: int, options=DEFAULT_OPTIONS):
+    """Render in a worker process; raises RenderPoolBusy when the queue is full"""
+    if not _slots.acquire(blocking=False):
+        raise RenderPoolBusy("Plot render queue is full")
+    try:
+        if PLOT_RENDER_WORKERS <= 0:
+            return await asyncio.to_thread(_draw_inline, role, slot, options)
+        pool = get_plot_pool()
+        try:
+            return await asyncio.wrap_future(pool.submit(draw_plot, role, slot, options))
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); start a fresh pool for the next request
+            logger.error("Plot renderer pool broke, restarting it")
+            _reset_broken_pool(pool)
+            raise
+    finally:
+        _slots.release()
@@ -1,71 +1,185 @@
 # plots/plot_router.py
 
-from fastapi import APIRouter, Response
-from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
-import matplotlib.pyplot as plt
-import seaborn as sns
-import pandas as pd
-from io import BytesIO
+import asyncio
+import base64
+import json
+import logging
+import os
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from registry.dataset_registry import get_dataset_version, registry
+from reports.report_cache import etag_matches
+from plots.plot_cache import plot_cache, plot_etag
+from plots.plot_data import plot_series
+from plots.plot_renderer import (
+    PLOTS, DEFAULT_OPTIONS, MEDIA_TYPES, WIDTH_RANGE, HEIGHT_RANGE, DPI_RANGE,
+    RenderPoolBusy, render_plot_async, render_plot_sync,
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Load datasets
-warehouse_df = pd.read_csv("data/warehouse_dataset.csv")
-store_df = pd.read_csv("data/store_manager_dataset.csv")
-executive_df = pd.read_csv("data/executive_insights_dataset.csv")
+# Cache key options for /data responses, kept apart from every image variant
+DATA_OPTIONS = (("format", "json"),)
 
+# Seconds clients may reuse a plot before revalidating with If-None-Match
+PLOT_MAX_AGE = int(os.getenv("PLOT_MAX_AGE", "60"))
 
-def fig_to_response(fig):
-    buf = BytesIO()
-    fig.tight_layout()
-    FigureCanvas(fig).print_png(buf)
-    plt.close(fig)
-    return Response(content=buf.getvalue(), media_type="image/png")
 
+async def get_plot_entry(role: str, slot: int, options=DEFAULT_OPTIONS, version=None):
+    """Return the cache entry (content, media_type, etag) for one plot, rendering on a miss"""
+    if version is None:
+        # May reload the CSV, so keep it off the event loop
+        version = await run_in_threadpool(get_dataset_version, PLOTS[role][slot][0])
+
+    entry = plot_cache.get((role, slot, version, options))
+    if entry is not None:
+        return entry
+
+    content, media_type, drawn_version = await render_plot_async(role, slot, options)
+    # The worker's registry may have picked up a newer file than ours; key on what was drawn
+    return plot_cache.put((role, slot, drawn_version, options), content, media_type)
+
+
+async def get_plot_data_entry(role: str, slot: int):
+    """Cache entry for the JSON series behind one plot; no pyplot, so it runs on the threadpool"""
+    dataset, kind, params = PLOTS[role][slot]
+    snapshot = await run_in_threadpool(registry.get, dataset)
+    key = (role, slot, snapshot.version, DATA_OPTIONS)
+
+    entry = plot_cache.get(key)
+    if entry is not None:
+        return entry
+
+    series = await run_in_threadpool(plot_series, snapshot.df, kind, params)
+    content = json.dumps(series, separators=(",", ":")).encode()
+    return plot_cache.put(key, content, "application/json")
+
+
+async def get_role_entries(role: str, options=DEFAULT_OPTIONS):
+    """Entries (or exceptions) for every plot of `role`, rendered concurrently"""
+    # Look each dataset version up once for the whole set
+    datasets = {dataset for dataset, _, _ in PLOTS[role]}
+    versions = {dataset: await run_in_threadpool(get_dataset_version, dataset) for dataset in datasets}
+    return await asyncio.gather(
+        *(get_plot_entry(role, slot, options, versions[dataset]) for slot, (dataset, _, _) in enumerate(PLOTS[role])),
+        return_exceptions=True,
+    )
+
+
+def prewarm_plots():
+    """Render every (role, slot) once so the first dashboard loads are served from memory"""
+    for role, plots in PLOTS.items():
+        for slot in range(len(plots)):
+            try:
+                content, media_type, version = render_plot_sync(role, slot)
+                plot_cache.put((role, slot, version, DEFAULT_OPTIONS), content, media_type)
+            except Exception as e:
+                logger.warning(f"Could not pre-warm plot {role}/{slot}: {e}")
+    logger.info(f"Pre-warmed plot cache: {plot_cache.stats()}")
+
+
+def cached_response(request: Request, entry):
+    content, media_type, etag = entry
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={PLOT_MAX_AGE}"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
+def plot_options(**overrides):
+    """Render options tuple (the cache key part) with `overrides` applied to the defaults"""
+    options = dict(DEFAULT_OPTIONS)
+    options.update(overrides)
+    return tuple(options.items())
+
+
+def render_options(
+    format: str = Query("png", pattern=f"^({'|'.join(MEDIA_TYPES)})$"),
+    width: int = Query(800, ge=WIDTH_RANGE[0], le=WIDTH_RANGE[1]),
+    height: int = Query(400, ge=HEIGHT_RANGE[0], le=HEIGHT_RANGE[1]),
+    dpi: int = Query(100, ge=DPI_RANGE[0], le=DPI_RANGE[1]),
+    exact: bool = False,
+):
+    """Query parameters shared by the image endpoints
+
+    width/height are in pixels; small dashboard tiles should ask for e.g. width=320&height=160.
+    `exact=true` draws every row even above PLOT_LARGE_ROWS (no hexbin / binned KDE).
+    """
+    return plot_options(format=format, width=width, height=height, dpi=dpi, exact=exact)
 
-@router.get("/plot/{role}/{index}")
-def get_plot(role: str, index: int):
-    fig, ax = plt.subplots(figsize=(8, 4))
 
+# Registered before /plot/{role}/{index} so "all" is not parsed as an index
+@router.get("/plot/{role}/all")
+async def get_role_plots(role: str, request: Request, options=Depends(render_options)):
+    """Every plot of a role in one JSON response, images base64-encoded
+
+    Plots that fail carry an "error" instead of "data"; the others are still returned.
+    """
+    role = role.lower().strip()
+
+    if role not in PLOTS:
+        return Response(status_code=404, content=f"Unsupported role: {role}")
+
+    results = await get_role_entries(role, options)
+    plots = []
+    for slot, result in enumerate(results):
+        if isinstance(result, Exception):
+            logger.error(f"Batch plot {role}/{slot} failed: {result}")
+            plots.append({"index": slot, "error": str(result), "busy": isinstance(result, RenderPoolBusy)})
+            continue
+        content, media_type, etag = result
+        plots.append({
+            "index": slot,
+            "media_type": media_type,
+            "etag": etag,
+            "data": base64.b64encode(content).decode("ascii"),
+        })
+
+    if all("error" in plot for plot in plots):
+        busy = all(plot["busy"] for plot in plots)
+        return Response(
+            status_code=503 if busy else 500,
+            content=f"Error generating plots: {plots[0]['error']}",
+            headers={"Retry-After": "1"} if busy else None,
+        )
+
+    body = json.dumps({"role": role, "plots": plots}, separators=(",", ":")).encode()
+    # Partial results are not cached downstream
+    if any("error" in plot for plot in plots):
+        return Response(content=body, media_type="application/json", headers={"Cache-Control": "no-store"})
+    etag = plot_etag(tuple(plot["etag"] for plot in plots))
+    return cached_response(request, (body, "application/json", etag))
+
+
+@router.get("/plot/{role}/{index}")
+async def get_plot(role: str, index: int, request: Request, options=Depends(render_options)):
+    """Render one role plot"""
     role = role.lower().strip()
 
-    if role == "warehouse ops manager":
-        plots = [
-            lambda: sns.histplot(warehouse_df["Inventory_Turnover"], kde=True, ax=ax),
-            lambda: sns.boxplot(x="Shipping_Mode", y="Shipping_Date", data=warehouse_df, ax=ax),
-            lambda: sns.scatterplot(x="Forecast_Accuracy_pct", y="Profit", data=warehouse_df, ax=ax),
-            lambda: sns.barplot(x="Order_Region", y="Total_Sales", data=warehouse_df, ax=ax),
-        ]
-    elif role == "store manager":
-        plots = [
-            lambda: sns.barplot(x="Supplier Name", y="Total Cost", data=store_df, ax=ax),
-            lambda: sns.boxplot(x="On Time Delivery", y="Lead Time (Days)", data=store_df, ax=ax),
-            lambda: sns.histplot(store_df["Inventory Health Score"], kde=True, ax=ax),
-            lambda: sns.scatterplot(x="Return Rate (%)", y="Damage Rate (%)", data=store_df, ax=ax),
-        ]
-    elif role == "executive":
-        plots = [
-            lambda: sns.barplot(x="Product Name", y="Net Profit", data=executive_df, ax=ax),
-            lambda: sns.scatterplot(x="ROI on Automation (%)", y="Automation Investment", data=executive_df, ax=ax),
-            lambda: sns.boxplot(x="Risk Status", y="Risk Score", data=executive_df, ax=ax),
-            lambda: sns.barplot(x="Region", y="Carbon Emission (kg)", data=executive_df, ax=ax),
-        ]
-    elif role == "supply chain manager":
-        if index % 2 == 0:
-            plots = [
-                lambda: sns.barplot(x="Shipping_Mode", y="Profit", data=warehouse_df, ax=ax),
-                lambda: sns.histplot(warehouse_df["Forecast_Accuracy_pct"], kde=True, ax=ax),
-            ]
-        else:
-            plots = [
-                lambda: sns.barplot(x="Supplier Country", y="Supplier Rating", data=store_df, ax=ax),
-                lambda: sns.scatterplot(x="Lead Time (Days)", y="Total Cost", data=store_df, ax=ax),
-            ]
-    else:
+    if role not in PLOTS:
         return Response(status_code=404, content=f"Unsupported role: {role}")
 
     try:
-        plots[index % len(plots)]()
-        return fig_to_response(fig)
+        entry = await get_plot_entry(role, index % len(PLOTS[role]), options)
+    except RenderPoolBusy as e:
+        return Response(status_code=503, content=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         return Response(status_code=500, content=f"Error generating plot: {str(e)}")
+    return cached_response(request, entry)
+
+
+@router.get("/plot/{role}/{index}/data")
+async def get_plot_data(role: str, index: int, request: Request):
+    """Aggregated series behind a plot (bins, quartiles, means with CIs) for client-side rendering"""
+    role = role.lower().strip()
+
+    if role not in PLOTS:
+        return Response(status_code=404, content=f"Unsupported role: {role}")
+
+    try:
+        entry = await get_plot_data_entry(role, index % len(PLOTS[role]))
+    except Exception as e:
+        return Response(status_code=500, content=f"Error aggregating plot data: {str(e)}")
+    return cached_response(request, entry)
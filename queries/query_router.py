@@ -1,19 +1,36 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from agents.ollama_agent import warehouse_agent, store_agent, exec_agent
+from agents.ollama_agent import warehouse_agent, store_agent, exec_agent, agent_events, quick_answer, request_key
+from agents.answer_cache import normalize_question
+from agents.query_metrics import snapshot as metrics_snapshot
+from agents.llm_client import QUERY_AGENT_CONCURRENCY, QueueFull, agent_limit, limit_stats
+from queries.single_flight import single_flight
+from agents.sandbox_pool import sandbox_pool
 import logging
 import asyncio
+import json
+import os
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor
-from typing import Union
+from typing import List, Union
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Questions one batch request may carry, and how many of its LLM queries run at once
+QUERY_BATCH_MAX = int(os.getenv("QUERY_BATCH_MAX", "50"))
+QUERY_BATCH_CONCURRENCY = int(os.getenv("QUERY_BATCH_CONCURRENCY", str(QUERY_AGENT_CONCURRENCY)))
+
 class QueryInput(BaseModel):
     question: str
 
+class BatchQueryInput(BaseModel):
+    questions: List[str]
 
 
 class QueryResponse(BaseModel):
@@ -21,8 +38,21 @@ class QueryResponse(BaseModel):
     status: str = "success"
     agent_used: str
 
-# Thread pool for agent execution
-executor = ThreadPoolExecutor(max_workers=3)
+# Thread pool for agent execution: enough for every agent to use its full limit at once,
+# so a burst of slow executive queries cannot starve the warehouse and store agents
+AGENT_NAMES = ("WarehouseAgent", "StoreAgent", "ExecutiveAgent")
+executor = ThreadPoolExecutor(max_workers=QUERY_AGENT_CONCURRENCY * len(AGENT_NAMES))
+
+async def run_limited(agent_fn, question: str, agent_name: str):
+    """run_agent_query on the thread pool once the agent has a free slot (waits on the loop)"""
+    async with agent_limit(agent_name).hold():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, run_agent_query, agent_fn, question, agent_name)
+
+async def run_coalesced(agent_fn, dataset: str, question: str, agent_name: str):
+    """run_limited, shared by concurrent requests for the same question on the same data"""
+    key = await run_in_threadpool(request_key, dataset, question, agent_name)
+    return await single_flight.do(key, lambda: run_limited(agent_fn, question, agent_name))
 
 def run_agent_query(agent_fn, question: str, agent_name: str):
     try:
@@ -55,15 +85,10 @@ def run_agent_query(agent_fn, question: str, agent_name: str):
 async def query_warehouse(input: QueryInput):
     logger.info(f"Processing warehouse query: {input.question}")
     try:
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            executor,
-            run_agent_query,
-            warehouse_agent,
-            input.question,
-            "WarehouseAgent"
-        )
+        result = await run_coalesced(warehouse_agent, "warehouse", input.question, "WarehouseAgent")
         return QueryResponse(**result)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=f"WarehouseAgent is busy: {str(e)}")
     except Exception as e:
         logger.critical(f"Critical error in warehouse endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Critical error: {str(e)}")
@@ -72,15 +97,10 @@ async def query_warehouse(input: QueryInput):
 async def query_store(input: QueryInput):
     logger.info(f"Processing store query: {input.question}")
     try:
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            executor,
-            run_agent_query,
-            store_agent,
-            input.question,
-            "StoreAgent"
-        )
+        result = await run_coalesced(store_agent, "store", input.question, "StoreAgent")
         return QueryResponse(**result)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=f"StoreAgent is busy: {str(e)}")
     except Exception as e:
         logger.critical(f"Critical error in store endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Critical error: {str(e)}")
@@ -89,19 +109,188 @@ async def query_store(input: QueryInput):
 async def query_exec(input: QueryInput):
     logger.info(f"Processing executive query: {input.question}")
     try:
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            executor,
-            run_agent_query,
-            exec_agent,
-            input.question,
-            "ExecutiveAgent"
-        )
+        result = await run_coalesced(exec_agent, "executive", input.question, "ExecutiveAgent")
         return QueryResponse(**result)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=f"ExecutiveAgent is busy: {str(e)}")
     except Exception as e:
         logger.critical(f"Critical error in executive endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Critical error: {str(e)}")
 
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def stream_agent_query(dataset: str, question: str, agent_name: str):
+    """SSE stream of the agent pipeline: token, cache, parsed, code_fixed, executed, result
+
+    The pipeline runs on the agent thread pool and is abandoned at the next event once the
+    client disconnects, which also closes the streaming request to the model. It keeps the
+    agent's slot until it has actually stopped, not just until the client has gone.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    cancelled = threading.Event()
+    limit = agent_limit(agent_name)
+
+    def produce():
+        events = agent_events(dataset, question, agent_name, stream=True)
+        try:
+            for event, data in events:
+                if cancelled.is_set():
+                    logger.info(f"Client went away, stopping {agent_name} query: {question}")
+                    break
+                if event == "result":
+                    data = {key: value for key, value in data.items() if key != "code"}
+                    data["agent_used"] = agent_name
+                loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+        except Exception as e:
+            logger.error(f"Error in {agent_name} stream: {str(e)}")
+            loop.call_soon_threadsafe(queue.put_nowait, ("result", {
+                "response": f"Error processing query: {str(e)}",
+                "status": "error",
+                "agent_used": agent_name
+            }))
+        finally:
+            events.close()
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+            loop.call_soon_threadsafe(limit.release)
+
+    async def body():
+        try:
+            await limit.acquire()
+        except QueueFull as e:
+            yield sse_event("result", {
+                "response": f"{agent_name} is busy: {str(e)}",
+                "status": "error",
+                "agent_used": agent_name
+            })
+            return
+        # From here produce() owns the slot and releases it when the pipeline ends
+        try:
+            loop.run_in_executor(executor, produce)
+        except BaseException:
+            limit.release()
+            raise
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                yield sse_event(*item)
+        finally:
+            # Also reached when Starlette cancels the response on disconnect
+            cancelled.set()
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/warehouse/stream")
+async def stream_warehouse(input: QueryInput):
+    logger.info(f"Streaming warehouse query: {input.question}")
+    return stream_agent_query("warehouse", input.question, "WarehouseAgent")
+
+@router.post("/store/stream")
+async def stream_store(input: QueryInput):
+    logger.info(f"Streaming store query: {input.question}")
+    return stream_agent_query("store", input.question, "StoreAgent")
+
+@router.post("/executive/stream")
+async def stream_exec(input: QueryInput):
+    logger.info(f"Streaming executive query: {input.question}")
+    return stream_agent_query("executive", input.question, "ExecutiveAgent")
+
+AGENTS = {
+    "warehouse": (warehouse_agent, "WarehouseAgent"),
+    "store": (store_agent, "StoreAgent"),
+    "executive": (exec_agent, "ExecutiveAgent"),
+}
+
+def stream_batch_query(dataset: str, agent_fn, questions: List[str], agent_name: str):
+    """SSE stream of one "result" event per question, in the order they finish, then "done"
+
+    Repeated questions are answered once and reported under each of their indexes. Intent
+    engine and answer cache hits are sent straight away; the rest run through the agent in
+    parallel, QUERY_BATCH_CONCURRENCY at a time, and are abandoned if the client disconnects.
+    """
+    unique = {}  # normalized question -> indexes in the request
+    for index, question in enumerate(questions):
+        unique.setdefault(normalize_question(question), []).append(index)
+    groups = list(unique.values())
+
+    def result_events(indexes, result):
+        result = {key: value for key, value in result.items() if key != "code"}
+        result["agent_used"] = agent_name
+        for index in indexes:
+            yield sse_event("result", {"index": index, "question": questions[index], **result})
+
+    async def answer(indexes, slots):
+        question = questions[indexes[0]]
+        async with slots:
+            try:
+                result = await run_coalesced(agent_fn, dataset, question, agent_name)
+            except QueueFull as e:
+                result = {"response": f"{agent_name} is busy: {str(e)}", "status": "error"}
+            except Exception as e:
+                logger.error(f"Error in {agent_name} batch: {str(e)}")
+                result = {"response": f"Error processing query: {str(e)}", "status": "error"}
+        return indexes, result
+
+    def lookup_all():
+        return [quick_answer(dataset, questions[indexes[0]], agent_name) for indexes in groups]
+
+    async def body():
+        started = time.monotonic()
+        quick = await run_in_threadpool(lookup_all)
+        slots = asyncio.Semaphore(QUERY_BATCH_CONCURRENCY)
+        tasks = [
+            asyncio.ensure_future(answer(indexes, slots))
+            for indexes, result in zip(groups, quick) if result is None
+        ]
+        try:
+            for indexes, result in zip(groups, quick):
+                if result is not None:
+                    for event in result_events(indexes, result):
+                        yield event
+            for next_done in asyncio.as_completed(tasks):
+                indexes, result = await next_done
+                for event in result_events(indexes, result):
+                    yield event
+        finally:
+            # Also reached when Starlette cancels the response on disconnect
+            for task in tasks:
+                task.cancel()
+        yield sse_event("done", {
+            "questions": len(questions),
+            "unique": len(groups),
+            "answered_without_llm": len(groups) - len(tasks),
+            "elapsed_s": round(time.monotonic() - started, 3),
+        })
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/{agent}/batch")
+async def query_batch(agent: str, input: BatchQueryInput):
+    if agent not in AGENTS:
+        raise HTTPException(status_code=404, detail=f"Unknown agent: {agent}")
+    if not input.questions:
+        raise HTTPException(status_code=400, detail="No questions given")
+    if len(input.questions) > QUERY_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {QUERY_BATCH_MAX} questions per batch")
+    agent_fn, agent_name = AGENTS[agent]
+    logger.info(f"Processing {agent} batch of {len(input.questions)} questions")
+    return stream_batch_query(agent, agent_fn, input.questions, agent_name)
+
+@router.get("/metrics")
+async def query_metrics():
+    return {"stages": metrics_snapshot(), **limit_stats(), "sandbox": sandbox_pool.stats()}
+
 @router.get("/health")
 async def health_check():
     return {
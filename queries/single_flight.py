@@ -0,0 +1,35 @@
+# queries/single_flight.py
+# Coalesce identical in-flight requests into one computation
+
+import asyncio
+import logging
+
+from agents.query_metrics import count
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight = {}  # key -> asyncio.Task
+
+    async def do(self, key, fn):
+        """Await fn() once per key; callers arriving while it runs share its result or error
+
+        The work runs as its own task, so a caller that disconnects does not cancel it for
+        the others.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            count("query.coalesced")
+        return await asyncio.shield(task)
+
+    def __len__(self):
+        return len(self._inflight)
+
+
+single_flight = SingleFlight()
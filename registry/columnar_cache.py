@@ -0,0 +1,155 @@
+# registry/columnar_cache.py
+# Typed Arrow IPC copies of the data/ CSVs, memory-mapped on load
+#
+# Build/refresh every dataset:   python -m registry.columnar_cache
+# CSV vs Arrow load benchmark:   python -m registry.columnar_cache --benchmark 1000000
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import pandas as pd
+import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+# Schema metadata keys tying an Arrow copy to the CSV it was built from
+META_MTIME = b"source_mtime_ns"
+META_SIZE = b"source_size"
+META_VERSION = b"source_version"
+
+
+def columnar_path(csv_path: str) -> str:
+    """Arrow copy lives next to the CSV: data/foo.csv -> data/foo.arrow"""
+    return os.path.splitext(csv_path)[0] + ".arrow"
+
+
+def write_columnar(df: pd.DataFrame, csv_path: str, version: str = "", stat=None) -> str:
+    """Write `df` as an uncompressed Arrow IPC file next to `csv_path`
+
+    `stat` should be the os.stat() of the CSV the frame was parsed from, so a CSV
+    rewritten in the meantime is not marked as up to date.
+    """
+    stat = stat or os.stat(csv_path)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        META_MTIME: str(stat.st_mtime_ns).encode(),
+        META_SIZE: str(stat.st_size).encode(),
+        META_VERSION: version.encode(),
+    })
+
+    path = columnar_path(csv_path)
+    # Write to a temp file and rename so readers never map a half-written copy
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".arrow.tmp")
+    os.close(fd)
+    try:
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def read_columnar_metadata(csv_path: str):
+    """Return the schema metadata of the Arrow copy, or None if there is none"""
+    path = columnar_path(csv_path)
+    if not os.path.exists(path):
+        return None
+    with pa.memory_map(path, "r") as source:
+        return pa.ipc.open_file(source).schema.metadata or {}
+
+
+def is_fresh(csv_path: str, metadata=None) -> bool:
+    """True when the Arrow copy was built from the CSV as it currently is on disk"""
+    metadata = read_columnar_metadata(csv_path) if metadata is None else metadata
+    if not metadata:
+        return False
+    stat = os.stat(csv_path)
+    return (
+        metadata.get(META_MTIME) == str(stat.st_mtime_ns).encode()
+        and metadata.get(META_SIZE) == str(stat.st_size).encode()
+    )
+
+
+def load_columnar(csv_path: str):
+    """Memory-map the Arrow copy and return (df, version)"""
+    source = pa.memory_map(columnar_path(csv_path), "r")
+    table = pa.ipc.open_file(source).read_all()
+    version = (table.schema.metadata or {}).get(META_VERSION, b"").decode()
+    return table.to_pandas(), version
+
+
+def build_all(paths: dict, force: bool = False):
+    """Build or refresh the Arrow copy of every dataset whose CSV exists"""
+    from registry.dataset_registry import DatasetRegistry
+
+    for name, csv_path in paths.items():
+        if not os.path.exists(csv_path):
+            logger.warning(f"Dataset '{name}' not found at {csv_path}, skipping")
+            continue
+        if not force and is_fresh(csv_path):
+            logger.info(f"Arrow copy of '{name}' is up to date")
+            continue
+        if os.path.exists(columnar_path(csv_path)):
+            os.remove(columnar_path(csv_path))
+        # Loading through a throwaway registry parses the CSV and writes the copy
+        DatasetRegistry({name: csv_path}).get(name)
+        logger.info(f"Built {columnar_path(csv_path)}")
+
+
+def benchmark(rows: int, source_csv: str = "data/executive_insights_dataset.csv", repeat: int = 3):
+    """Compare CSV parsing against the memory-mapped Arrow load on a synthetic dataset"""
+    import numpy as np
+
+    base = pd.read_csv(source_csv)
+    rng = np.random.default_rng(0)
+    synthetic = base.iloc[rng.integers(0, len(base), rows)].reset_index(drop=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "executive_synthetic.csv")
+        synthetic.to_csv(csv_path, index=False)
+        write_columnar(synthetic, csv_path)
+
+        def best_of(fn):
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                fn()
+                timings.append(time.perf_counter() - start)
+            return min(timings)
+
+        csv_time = best_of(lambda: pd.read_csv(csv_path))
+        arrow_time = best_of(lambda: load_columnar(csv_path))
+        csv_mb = os.path.getsize(csv_path) / 1e6
+        arrow_mb = os.path.getsize(columnar_path(csv_path)) / 1e6
+
+    print(f"Rows: {rows:,}")
+    print(f"CSV   read_csv      : {csv_time:8.3f}s  ({csv_mb:,.1f} MB)")
+    print(f"Arrow memory-mapped : {arrow_time:8.3f}s  ({arrow_mb:,.1f} MB)")
+    print(f"Speedup             : {csv_time / arrow_time:8.1f}x")
+
+
+def main():
+    from registry.dataset_registry import DATASET_PATHS
+
+    parser = argparse.ArgumentParser(description="Build Arrow copies of the data/ CSVs")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the copy is up to date")
+    parser.add_argument("--benchmark", type=int, metavar="ROWS", help="run the CSV vs Arrow load benchmark")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.benchmark:
+        benchmark(args.benchmark)
+    else:
+        build_all(DATASET_PATHS, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
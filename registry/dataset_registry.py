@@ -0,0 +1,160 @@
+# registry/dataset_registry.py
+# Process-wide dataset registry shared by the agents, plots and reports routers
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from io import BytesIO
+
+import pandas as pd
+
+from registry.columnar_cache import META_VERSION, is_fresh, load_columnar, read_columnar_metadata, write_columnar
+
+logger = logging.getLogger(__name__)
+
+DATASET_PATHS = {
+    "warehouse": "data/warehouse_dataset.csv",
+    "store": "data/store_manager_dataset.csv",
+    "executive": "data/executive_insights_dataset.csv",
+}
+
+# Seconds between stat() calls on the backing file of a dataset
+CHECK_INTERVAL = float(os.getenv("DATASET_CHECK_INTERVAL", "2.0"))
+
+# Keep a memory-mapped Arrow copy next to each CSV (see registry/columnar_cache.py)
+USE_COLUMNAR_CACHE = os.getenv("DATASET_COLUMNAR_CACHE", "1") == "1"
+
+
+@dataclass(frozen=True)
+class DatasetSnapshot:
+    name: str
+    path: str
+    df: pd.DataFrame
+    version: str
+    mtime_ns: int
+    size: int
+    loaded_at: float
+
+
+class DatasetRegistry:
+    """Loads each dataset once and swaps in a new snapshot when its file changes"""
+
+    def __init__(self, paths, check_interval=CHECK_INTERVAL):
+        self.paths = dict(paths)
+        self.check_interval = check_interval
+        self._snapshots = {}
+        self._checked_at = {}
+        self._locks = {name: threading.Lock() for name in self.paths}
+
+    def get(self, name: str) -> DatasetSnapshot:
+        """Return the current snapshot, reloading it if the file has changed"""
+        if name not in self.paths:
+            raise KeyError(f"Unknown dataset: {name}")
+
+        snapshot = self._snapshots.get(name)
+        now = time.monotonic()
+        if snapshot is not None and now - self._checked_at.get(name, 0) < self.check_interval:
+            return snapshot
+
+        with self._locks[name]:
+            # Another thread may have refreshed it while we waited on the lock
+            snapshot = self._snapshots.get(name)
+            if snapshot is not None and now - self._checked_at.get(name, 0) < self.check_interval:
+                return snapshot
+
+            try:
+                snapshot = self._refresh(name, snapshot)
+            except Exception as e:
+                if snapshot is None:
+                    raise
+                # A half-written file should not take the dataset down, keep serving the last good snapshot
+                logger.error(f"Failed to reload dataset '{name}', keeping version {snapshot.version}: {e}")
+            self._checked_at[name] = time.monotonic()
+            return snapshot
+
+    def frame(self, name: str) -> pd.DataFrame:
+        return self.get(name).df
+
+    def version(self, name: str) -> str:
+        return self.get(name).version
+
+    def versions(self) -> dict:
+        return {name: snap.version for name, snap in self._snapshots.items()}
+
+    def preload(self):
+        """Load every dataset whose file exists; missing files are logged and skipped"""
+        for name, path in self.paths.items():
+            if not os.path.exists(path):
+                logger.warning(f"Dataset '{name}' not found at {path}, skipping preload")
+                continue
+            self.get(name)
+
+    def _refresh(self, name, current):
+        path = self.paths[name]
+        stat = os.stat(path)
+        if current is not None and (stat.st_mtime_ns, stat.st_size) == (current.mtime_ns, current.size):
+            return current
+
+        df = version = None
+        if USE_COLUMNAR_CACHE:
+            df, version = self._load_columnar(name, path, current)
+
+        if df is None:
+            with open(path, "rb") as f:
+                raw = f.read()
+            digest = hashlib.sha1(raw).hexdigest()[:16]
+
+            if current is not None and current.version.endswith(digest):
+                # File was touched but the content is identical, keep the parsed frame and version
+                df, version = current.df, current.version
+            else:
+                df, version = pd.read_csv(BytesIO(raw)), f"{stat.st_mtime_ns}-{digest}"
+                logger.info(f"Loaded dataset '{name}' from {path} ({len(df)} rows, version {version})")
+
+            if USE_COLUMNAR_CACHE:
+                try:
+                    write_columnar(df, path, version, stat=stat)
+                except Exception as e:
+                    logger.warning(f"Could not write Arrow copy of '{name}': {e}")
+
+        snapshot = DatasetSnapshot(
+            name=name,
+            path=path,
+            df=df,
+            version=version,
+            mtime_ns=stat.st_mtime_ns,
+            size=stat.st_size,
+            loaded_at=time.time(),
+        )
+        # Single reference assignment, readers see either the old or the new snapshot
+        self._snapshots[name] = snapshot
+        return snapshot
+
+    def _load_columnar(self, name, path, current):
+        """Return (df, version) from an up-to-date Arrow copy, or (None, None)"""
+        try:
+            metadata = read_columnar_metadata(path)
+            if not metadata or not is_fresh(path, metadata):
+                return None, None
+            if current is not None and metadata.get(META_VERSION, b"").decode() == current.version:
+                return current.df, current.version
+            df, version = load_columnar(path)
+            logger.info(f"Loaded dataset '{name}' from Arrow copy ({len(df)} rows, version {version})")
+            return df, version
+        except Exception as e:
+            logger.warning(f"Arrow copy of '{name}' unreadable, falling back to CSV: {e}")
+            return None, None
+
+
+registry = DatasetRegistry(DATASET_PATHS)
+
+
+def get_dataset(name: str) -> pd.DataFrame:
+    return registry.frame(name)
+
+
+def get_dataset_version(name: str) -> str:
+    return registry.version(name)
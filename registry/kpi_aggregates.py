@@ -0,0 +1,181 @@
+# registry/kpi_aggregates.py
+# Materialized KPI group-bys shared by reports, plots and queries
+#
+# Aggregates are computed once per DataFrame object. The registry hands out one
+# DataFrame per dataset version, so in practice each aggregate is computed once per
+# dataset version and dropped when that version is garbage collected.
+
+import logging
+import os
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def mean_ci(df, by, col):
+    """Per-group mean of `col` (kept under its own name) plus a normal-approximation 95% CI"""
+    stats = df.groupby(by)[col].agg(["mean", "std", "count"])
+    out = pd.DataFrame({
+        col: stats["mean"],
+        "ci": (1.96 * stats["std"] / np.sqrt(stats["count"])).fillna(0),
+        "count": stats["count"],
+    })
+    return out.reset_index()
+
+
+def late_aging_by_supplier(df):
+    late = df[df['On Time Delivery'] < 1]
+    return late.groupby('Supplier Name')['PO Aging (Days)'].mean().reset_index()
+
+
+# name -> (required columns, function of the full DataFrame)
+AGGREGATES = {
+    # Executive
+    "revenue_expenses_by_business_unit": (
+        ["Business Unit", "Revenue", "Expenses"],
+        lambda df: df.groupby("Business Unit")[["Revenue", "Expenses"]].sum().reset_index(),
+    ),
+    "roi_by_region": (["Region", "ROI (%)"], lambda df: mean_ci(df, "Region", "ROI (%)")),
+    "risk_score_by_region": (["Region", "Risk Score"], lambda df: mean_ci(df, "Region", "Risk Score")),
+    "net_profit_by_product": (["Product Name", "Net Profit"], lambda df: mean_ci(df, "Product Name", "Net Profit")),
+    "carbon_emission_by_region": (
+        ["Region", "Carbon Emission (kg)"],
+        lambda df: mean_ci(df, "Region", "Carbon Emission (kg)"),
+    ),
+    "initiative_impact": (
+        ["Strategic Initiative", "Initiative Impact Score", "Projected Growth (%)"],
+        lambda df: df.groupby("Strategic Initiative")[["Initiative Impact Score", "Projected Growth (%)"]].mean()
+        .sort_values("Initiative Impact Score", ascending=False).reset_index(),
+    ),
+    # Warehouse
+    "total_sales_by_category": (
+        ["Category", "Total_Sales"],
+        lambda df: df.groupby("Category")["Total_Sales"].sum().reset_index(),
+    ),
+    "total_sales_by_segment": (
+        ["Customer_Segment", "Total_Sales"],
+        lambda df: df.groupby("Customer_Segment")["Total_Sales"].sum().reset_index(),
+    ),
+    "total_sales_by_region": (["Order_Region", "Total_Sales"], lambda df: mean_ci(df, "Order_Region", "Total_Sales")),
+    "fill_rate_by_category": (["Category", "Fill_Rate_pct"], lambda df: mean_ci(df, "Category", "Fill_Rate_pct")),
+    "delay_by_region": (
+        ["Order_Region", "Transportation_Delay_Days"],
+        lambda df: mean_ci(df, "Order_Region", "Transportation_Delay_Days"),
+    ),
+    "profit_by_shipping_mode": (["Shipping_Mode", "Profit"], lambda df: mean_ci(df, "Shipping_Mode", "Profit")),
+    "orders_by_region": (
+        ["Order_Region", "Order ID"],
+        lambda df: df.groupby("Order_Region")["Order ID"].count().reset_index(),
+    ),
+    "orders_by_date": (
+        ["Order_Date", "Order ID"],
+        lambda df: df.groupby("Order_Date")["Order ID"].count().reset_index(),
+    ),
+    "picking_accuracy_by_department": (
+        ["Department", "Picking_Accuracy (%)"],
+        lambda df: df.groupby("Department")["Picking_Accuracy (%)"].mean().reset_index(),
+    ),
+    # Store
+    "aging_lead_time_by_supplier": (
+        ["Supplier Name", "PO Aging (Days)", "Lead Time (Days)"],
+        lambda df: df.groupby("Supplier Name")[["PO Aging (Days)", "Lead Time (Days)"]].mean().reset_index(),
+    ),
+    "on_time_by_supplier": (
+        ["Supplier Name", "On Time Delivery"],
+        lambda df: df.groupby("Supplier Name")["On Time Delivery"].mean().reset_index(),
+    ),
+    "late_aging_by_supplier": (["Supplier Name", "On Time Delivery", "PO Aging (Days)"], late_aging_by_supplier),
+    "total_cost_by_supplier": (["Supplier Name", "Total Cost"], lambda df: mean_ci(df, "Supplier Name", "Total Cost")),
+    "supplier_rating_by_country": (
+        ["Supplier Country", "Supplier Rating"],
+        lambda df: mean_ci(df, "Supplier Country", "Supplier Rating"),
+    ),
+    "forecast_replenishment_by_category": (
+        ["Category", "Forecast Demand (30d)", "Suggested Replenishment"],
+        lambda df: df.groupby("Category")[["Forecast Demand (30d)", "Suggested Replenishment"]].sum().reset_index(),
+    ),
+    "cost_variance_by_category": (
+        ["Category", "Cost Variance"],
+        lambda df: df.groupby("Category")["Cost Variance"].sum().reset_index(),
+    ),
+}
+
+_cache = {}  # id(df) -> {name: aggregate}
+_lock = threading.Lock()
+
+
+def _reset_lock():
+    global _lock
+    _lock = threading.Lock()
+
+
+# Forked sandbox workers inherit the cache; the lock may have been held by another thread
+os.register_at_fork(after_in_child=_reset_lock)
+
+
+def available(df: pd.DataFrame) -> list:
+    """Names of the aggregates whose columns all exist in `df`"""
+    return [name for name, (columns, _) in AGGREGATES.items() if all(col in df.columns for col in columns)]
+
+
+def kpi(df: pd.DataFrame, name: str) -> pd.DataFrame:
+    """Return the materialized aggregate `name` for `df`, computing it on first use
+
+    Callers must treat the result as read-only; it is shared with every other caller.
+    """
+    key = id(df)
+    with _lock:
+        entries = _cache.get(key)
+        if entries is None:
+            entries = _cache[key] = {}
+            # Drop the entries once the DataFrame they were computed from goes away
+            weakref.finalize(df, _cache.pop, key, None)
+        if name in entries:
+            return entries[name]
+
+    columns, fn = AGGREGATES[name]
+    missing = [col for col in columns if col not in df.columns]
+    if missing:
+        raise KeyError(f"Aggregate '{name}' needs missing columns: {missing}")
+    result = fn(df)
+    with _lock:
+        entries.setdefault(name, result)
+    return entries[name]
+
+
+def materialize(df: pd.DataFrame) -> dict:
+    """Compute every aggregate `df` supports up front"""
+    return {name: kpi(df, name) for name in available(df)}
+
+
+class FrameAggregates:
+    """Read-only mapping view, e.g. exposed as `kpi` to generated query code"""
+
+    def __init__(self, df: pd.DataFrame):
+        self._df = df
+        self._names = available(df)
+
+    def __getitem__(self, name):
+        if name not in self._names:
+            raise KeyError(f"Unknown aggregate: {name}")
+        # Under copy-on-write a shallow copy is already isolated from the shared aggregate
+        return kpi(self._df, name).copy(deep=not pd.options.mode.copy_on_write)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def keys(self):
+        return list(self._names)
+
+
+def barplot_mean_ci(agg: pd.DataFrame, x: str, y: str, ax):
+    """Seaborn-styled bar chart of a mean_ci() aggregate with its error bars"""
+    import seaborn as sns
+
+    sns.barplot(data=agg, x=x, y=y, errorbar=None, ax=ax)
+    ax.errorbar(range(len(agg)), agg[y], yerr=agg["ci"], fmt="none", ecolor=".26", elinewidth=2.7)
+    return ax
@@ -0,0 +1,140 @@
+# reports/report_cache.py
+# Content-addressed, size-bounded on-disk cache for generated PDF reports
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.getenv("REPORT_CACHE_DIR", ".report_cache")
+CACHE_MAX_BYTES = int(os.getenv("REPORT_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+
+def report_key(report_type: str, params: dict, dataset_version: str) -> str:
+    """Stable key for a report built from a given dataset version"""
+    payload = json.dumps(
+        {"type": report_type, "params": params, "version": dataset_version},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ReportCache:
+    """LRU of finished PDFs on disk, bounded by total size in bytes"""
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self._entries = OrderedDict()  # key -> size, least recently used first
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def get(self, key: str):
+        """Return the cached PDF path for `key`, or None"""
+        with self._lock:
+            if key not in self._entries:
+                return None
+            path = self.path_for(key)
+            if not os.path.exists(path):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        # Keep mtime in step with recency so the order survives a restart
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def get_or_build(self, key: str, build_fn) -> str:
+        """Return the cached PDF for `key`, calling build_fn(output_path) on a miss
+
+        Concurrent misses for the same key wait for a single build.
+        """
+        path = self.get(key)
+        if path:
+            return path
+
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            path = self.get(key)
+            if path:
+                return path
+
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".pdf.tmp")
+            os.close(fd)
+            try:
+                build_fn(tmp_path)
+                path = self.path_for(key)
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            finally:
+                with self._lock:
+                    self._build_locks.pop(key, None)
+
+            with self._lock:
+                self._entries[key] = os.path.getsize(path)
+                self._entries.move_to_end(key)
+                self._evict(keep=key)
+            logger.info(f"Cached report {key[:12]} ({self._entries.get(key, 0)} bytes)")
+            return path
+
+    def _evict(self, keep=None):
+        total = sum(self._entries.values())
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._entries.pop(key)
+            try:
+                os.remove(self.path_for(key))
+            except OSError:
+                pass
+            logger.info(f"Evicted cached report {key[:12]}")
+
+    def _load_index(self):
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".pdf.tmp"):
+                # Left over from a build that was interrupted
+                os.remove(path)
+            elif name.endswith(".pdf"):
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+        self._evict()
+
+
+def etag_for(key: str) -> str:
+    return f'"{key}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """True when an If-None-Match header value covers `etag`"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+report_cache = ReportCache()
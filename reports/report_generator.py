@@ -4,12 +4,26 @@ matplotlib.use('Agg')
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
+import logging
+import multiprocessing
+import numpy as np
 import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from fpdf import FPDF
 from datetime import datetime
+from registry.kpi_aggregates import AGGREGATES, barplot_mean_ci, kpi
 
 sns.set(style="whitegrid")
 
+logger = logging.getLogger(__name__)
+
+# Processes used to render report charts; 1 renders them inline
+RENDER_WORKERS = int(os.getenv("REPORT_RENDER_WORKERS", str(os.cpu_count() or 1)))
+
 # ---------- PDF Base Class ----------
 class PDF(FPDF):
     def header(self):
@@ -22,24 +36,129 @@ class PDF(FPDF):
         self.set_font("Arial", "I", 8)
         self.cell(0, 10, f"Page {self.page_no()}", 0, 0, "C")
 
+    def chart(self, name, info, w=0, h=0):
+        """Place an in-memory image from save_plot() without touching the disk"""
+        if name not in self.images:
+            # FPDF only parses files for names it hasn't seen, so registering it first skips that
+            self.images[name] = dict(info, i=len(self.images) + 1)
+        self.image(name, w=w, h=h)
+
 # ---------- Utilities ----------
-def save_plot(fig, filename):
-    """Save plot and verify it's a valid PNG"""
+def save_plot(fig, name):
+    """Rasterise plot into an FPDF image dict (Flate-compressed RGB, same pixels as savefig)"""
     try:
         fig.tight_layout()
-        fig.savefig(filename, format='png')
+        canvas = FigureCanvasAgg(fig)
+        canvas.draw()
+        rgba = np.asarray(canvas.buffer_rgba())
         plt.close(fig)
 
-        # Validate PNG header (first 8 bytes: \x89PNG\r\n\x1a\n)
-        with open(filename, 'rb') as f:
-            header = f.read(8)
-            if header != b'\x89PNG\r\n\x1a\n':
-                raise ValueError(f"{filename} is not a valid PNG file.")
+        # Figures are drawn on an opaque background, so alpha can be dropped rather than
+        # handed to FPDF's per-row soft-mask extraction. Each row gets a leading 0 byte,
+        # the "no filter" tag the PNG predictor in /DecodeParms expects.
+        h, w = rgba.shape[:2]
+        rows = np.zeros((h, w * 3 + 1), dtype=np.uint8)
+        rows[:, 1:] = rgba[:, :, :3].reshape(h, w * 3)
+        return {
+            'w': w, 'h': h, 'cs': 'DeviceRGB', 'bpc': 8, 'f': 'FlateDecode',
+            'dp': f'/Predictor 15 /Colors 3 /BitsPerComponent 8 /Columns {w}',
+            'pal': '', 'trns': '', 'data': zlib.compress(rows.tobytes()),
+        }
     except Exception as e:
-        print(f"Error saving {filename}: {e}")
+        print(f"Error saving {name}: {e}")
         raise
 
 
+# ---------- Chart Rendering ----------
+# Phase 1 of every report: each chart is a top-level function of the DataFrame so it
+# can run in a worker process. Phase 2 assembles the PDF in order from the results.
+_render_pool = None
+
+
+def render_chart(name, chart_fn, df):
+    """Render one chart and return (name, image dict, seconds)"""
+    start = time.perf_counter()
+    image = save_plot(chart_fn(df), name)
+    return name, image, time.perf_counter() - start
+
+
+def get_render_pool():
+    global _render_pool
+    if _render_pool is None:
+        # spawn: forking a threaded uvicorn worker can inherit held locks
+        _render_pool = ProcessPoolExecutor(
+            max_workers=RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _render_pool
+
+
+def shutdown_render_pool():
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(cancel_futures=True)
+        _render_pool = None
+
+
+def chart_input(df, source):
+    """Data handed to a chart function, or None if `df` can't provide it
+
+    `source` is either a list of required columns, or the name of a KPI aggregate
+    (see registry/kpi_aggregates.py) so the group-by is shared rather than redone.
+    """
+    if isinstance(source, str):
+        columns = AGGREGATES[source][0]
+        return kpi(df, source) if all(col in df.columns for col in columns) else None
+    return df[list(source)] if all(col in df.columns for col in source) else None
+
+
+def render_charts(df, charts, report_name):
+    """Render every chart whose data is available; returns {name: image dict}
+
+    `charts` is a list of (name, chart_fn, source), see chart_input(). Workers only
+    receive the columns or the aggregate their chart needs.
+    """
+    jobs = []
+    for name, chart_fn, source in charts:
+        data = chart_input(df, source)
+        if data is not None:
+            jobs.append((name, chart_fn, data))
+
+    start = time.perf_counter()
+    results = None
+    if RENDER_WORKERS > 1 and len(jobs) > 1:
+        try:
+            pool = get_render_pool()
+            futures = [pool.submit(render_chart, *job) for job in jobs]
+            results = [future.result() for future in futures]
+        except BrokenProcessPool as e:
+            logger.error(f"Chart render pool broke, rendering {report_name} charts inline: {e}")
+            shutdown_render_pool()
+    if results is None:
+        results = [render_chart(*job) for job in jobs]
+
+    timings = ", ".join(f"{name}={seconds:.2f}s" for name, _, seconds in sorted(results, key=lambda r: -r[2]))
+    logger.info(f"Rendered {len(results)} {report_name} charts in {time.perf_counter() - start:.2f}s ({timings})")
+    return {name: image for name, image, _ in results}
+
+
+def report_progress(progress, section):
+    """Tell an optional progress callback that `section` is starting
+
+    The callback may raise to abort the build (used to cancel report jobs).
+    """
+    if progress is not None:
+        progress(section)
+
+
+def add_chart(pdf, charts, name, w=180):
+    """Place a rendered chart if it was produced; returns whether it was placed"""
+    if name not in charts:
+        return False
+    pdf.chart(name, charts[name], w=w)
+    return True
+
+
 def draw_table(pdf, title, dataframe, col_widths=None, max_rows=10):
     """Draw a formatted table in PDF"""
     pdf.set_font("Arial", "B", 11)
@@ -69,8 +188,129 @@ def add_insight_section(pdf, insights):
         pdf.multi_cell(0, 8, f"- {insight}")
 
 # ---------- Warehouse Weekly Report ----------
-def generate_warehouse_report(df, output_path="warehouse_weekly_report.pdf"):
+def chart_fulfill(df):
+    fig, ax = plt.subplots()
+    sns.histplot(df['Order_Fulfillment (Days)'], kde=True, ax=ax)
+    ax.set_title("Order Fulfillment Time Distribution")
+    return fig
+
+def chart_daily_orders(agg):
+    fig, ax = plt.subplots()
+    daily_orders = agg.set_index('Order_Date')['Order ID']
+    daily_orders.plot(kind='bar', ax=ax)
+    ax.set_title("Daily Orders Processed")
+    ax.tick_params(axis='x', rotation=45)
+    return fig
+
+def chart_status(df):
+    fig, ax = plt.subplots()
+    df['Order_Status'].value_counts().plot.pie(autopct="%1.1f%%", ax=ax)
+    ax.set_title("Order Status Breakdown")
+    return fig
+
+def chart_inv_forecast(df):
+    fig, ax = plt.subplots()
+    df[['Inventory_Accuracy (%)', 'Forecast_Accuracy_pct']].plot(ax=ax)
+    ax.set_title("Inventory Accuracy vs Forecast Accuracy")
+    return fig
+
+def chart_fillrate(agg):
+    fig, ax = plt.subplots()
+    barplot_mean_ci(agg, x='Category', y='Fill_Rate_pct', ax=ax)
+    ax.set_title("Fill Rate by Category")
+    ax.tick_params(axis='x', rotation=45)
+    return fig
+
+def chart_pickdept(agg):
+    fig, ax = plt.subplots()
+    pick_by_dept = agg.set_index("Department")['Picking_Accuracy (%)']
+    pick_by_dept.plot(kind='bar', ax=ax)
+    ax.set_title("Picking Accuracy by Department")
+    return fig
+
+def chart_laboreff(df):
+    fig, ax = plt.subplots()
+    ax.scatter(df['Labor_Hours'], df['Items_Picked'])
+    ax.set_xlabel("Labor Hours")
+    ax.set_ylabel("Items Picked")
+    ax.set_title("Labor Hours vs Items Picked")
+    return fig
+
+def chart_delayregion(agg):
+    fig, ax = plt.subplots()
+    barplot_mean_ci(agg, x='Order_Region', y='Transportation_Delay_Days', ax=ax)
+    ax.set_title("Transportation Delay by Region")
+    return fig
+
+def chart_shipmode(df):
+    fig, ax = plt.subplots()
+    df['Shipping_Mode'].value_counts().plot.pie(autopct='%1.1f%%', ax=ax)
+    ax.set_title("Shipping Mode Usage")
+    return fig
+
+def chart_profitdisc(df):
+    fig, ax = plt.subplots()
+    sns.scatterplot(data=df, x='Discount_Rate', y='Profit', ax=ax)
+    ax.set_title("Profit vs Discount Rate")
+    return fig
+
+def chart_salescat(agg):
+    fig, ax = plt.subplots()
+    agg.set_index("Category")['Total_Sales'].plot(kind='bar', ax=ax)
+    ax.set_title("Sales by Category")
+    ax.tick_params(axis='x', rotation=45)
+    return fig
+
+def chart_spacetrend(df):
+    fig, ax = plt.subplots()
+    df['Space_Utilization (%)'].plot(ax=ax)
+    ax.set_title("Space Utilization Trend")
+    return fig
+
+def chart_orders_region(agg):
+    fig, ax = plt.subplots()
+    agg.set_index('Order_Region')['Order ID'].plot(kind='bar', ax=ax)
+    ax.set_title("Orders by Region")
+    return fig
+
+def chart_segment_value(agg):
+    fig, ax = plt.subplots()
+    agg.set_index('Customer_Segment')['Total_Sales'].plot(kind='bar', ax=ax)
+    ax.set_title("Customer Segment vs Order Value")
+    return fig
+
+WAREHOUSE_CHARTS = [
+    ("fulfill", chart_fulfill, ['Order_Fulfillment (Days)']),
+    ("daily_orders", chart_daily_orders, "orders_by_date"),
+    ("status", chart_status, ['Order_Status']),
+    ("inv_forecast", chart_inv_forecast, ['Inventory_Accuracy (%)', 'Forecast_Accuracy_pct']),
+    ("fillrate", chart_fillrate, "fill_rate_by_category"),
+    ("pickdept", chart_pickdept, "picking_accuracy_by_department"),
+    ("laboreff", chart_laboreff, ['Labor_Hours', 'Items_Picked']),
+    ("delayregion", chart_delayregion, "delay_by_region"),
+    ("shipmode", chart_shipmode, ['Shipping_Mode']),
+    ("profitdisc", chart_profitdisc, ['Discount_Rate', 'Profit']),
+    ("salescat", chart_salescat, "total_sales_by_category"),
+    ("spacetrend", chart_spacetrend, ['Space_Utilization (%)']),
+    ("orders_region", chart_orders_region, "orders_by_region"),
+    ("segment_value", chart_segment_value, "total_sales_by_segment"),
+]
+
+WAREHOUSE_SECTIONS = [
+    "Charts", "I. Executive Summary", "II. Order Processing & Fulfillment",
+    "III. Inventory & Accuracy Metrics", "IV. Picking Performance & Labor Efficiency",
+    "V. Shipping & Transportation", "VI. Sales & Profitability",
+    "VII. Space & Resource Utilization", "VIII. Regional & Customer Segment Insights",
+    "IX. GenAI Insights", "PDF Output",
+]
+
+def generate_warehouse_report(df, output_path="warehouse_weekly_report.pdf", progress=None):
     """Generate comprehensive warehouse weekly operations report"""
+    report_progress(progress, "Charts")
+    charts = render_charts(df, WAREHOUSE_CHARTS, "warehouse")
+    return _assemble_warehouse_report(df, charts, output_path, progress)
+
+def _assemble_warehouse_report(df, charts, output_path, progress):
     pdf = PDF()
     pdf.add_page()
     
@@ -86,6 +326,7 @@ def generate_warehouse_report(df, output_path="warehouse_weekly_report.pdf"):
     pdf.ln(5)
     
     # --- I. EXECUTIVE SUMMARY ---
+    report_progress(progress, "I. Executive Summary")
     pdf.set_font("Arial", 'B', 12)
     pdf.cell(0, 10, "I. Executive Summary", ln=True)
     pdf.set_font("Arial", size=10)
@@ -103,6 +344,7 @@ def generate_warehouse_report(df, output_path="warehouse_weekly_report.pdf"):
     pdf.ln(4)
     
     # --- II. ORDER PROCESSING ---
+    report_progress(progress, "II. Order Processing & Fulfillment")
     pdf.set_font("Arial", 'B', 12)
     pdf.cell(0, 10, "II. Order Processing & Fulfillment", ln=True)
     pdf.set_font("Arial", size=10)
@@ -116,32 +358,17 @@ def generate_warehouse_report(df, output_path="warehouse_weekly_report.pdf"):
         pdf.cell(0, 8, f"Shipping Accuracy (%): {on_time}%", ln=True)
     
     # Graph 1: Order Fulfillment Time Distribution
-    fig, ax = plt.subplots()
-    sns.histplot(df['Order_Fulfillment (Days)'], kde=True, ax=ax)
-    ax.set_title("Order Fulfillment Time Distribution")
-    save_plot(fig, "fulfill.png")
-    pdf.image("fulfill.png", w=180)
+    add_chart(pdf, charts, "fulfill", w=180)
     
     # Graph 2: Daily Orders
-    if 'Order_Date' in df.columns:
-        fig, ax = plt.subplots()
-        daily_orders = df.groupby('Order_Date')['Order ID'].count()
-        daily_orders.plot(kind='bar', ax=ax)
-        ax.set_title("Daily Orders Processed")
-        ax.tick_params(axis='x', rotation=45)
-        save_plot(fig, "daily_orders.png")
-        pdf.image("daily_orders.png", w=180)
+    add_chart(pdf, charts, "daily_orders", w=180)
     
     # Graph 3: Order Status Breakdown
-    if 'Order_Status' in df.columns:
-        fig, ax = plt.subplots()
-        df['Order_Status'].value_counts().plot.pie(autopct="%1.1f%%", ax=ax)
-        ax.set_title("Order Status Breakdown")
-        save_plot(fig, "status.png")
-        pdf.image("status.png", w=140)
+    add_chart(pdf, charts, "status", w=140)
     
     # --- III. INVENTORY METRICS ---
     pdf.add_page()
+    report_progress(progress, "III. Inventory & Accuracy Metrics")
     pdf.set_font("Arial", 'B', 12)
     pdf.cell(0, 10, "III. Inventory & Accuracy Metrics", ln=True)
     pdf.set_font("Arial", size=10)
@@ -155,23 +382,13 @@ def generate_warehouse_report(df, output_path="warehouse_weekly_report.pdf"):
     pdf.cell(0, 8, f"Forecast Accuracy (%): {forecast_acc}%", ln=True)
     
     # Graph 4: Inventory vs Forecast Accuracy
-    if 'Inventory_Accuracy (%)' in df.columns and 'Forecast_Accuracy_pct' in df.columns:
-        fig, ax = plt.subplots()
-        df[['Inventory_Accuracy (%)', 'Forecast_Accuracy_pct']].plot(ax=ax)
-        ax.set_title("Inventory Accuracy vs Forecast Accuracy")
-        save_plot(fig, "inv_forecast.png")
-        pdf.image("inv_forecast.png", w=180)
+    add_chart(pdf, charts, "inv_forecast", w=180)
     
     # Graph 5: Fill Rate by Category
-    if 'Category' in df.columns and 'Fill_Rate_pct' in df.columns:
-        fig, ax = plt.subplots()
-        sns.barplot(data=df, x='Category', y='Fill_Rate_pct', ax=ax)
-        ax.set_title("Fill Rate by Category")
-        ax.tick_params(axis='x', rotation=45)
-        save_plot(fig, "fillrate.png")
-        pdf.image("fillrate.png", w=180)
+    add_chart(pdf, charts, "fillrate", w=180)
     
     # --- IV. PICKING PERFORMANCE ---
+    report_progress(progress, "IV. Picking Performance & Labor Efficiency")
     pdf.set_font("Arial", 'B', 12)
     pdf.cell(0, 10, "IV. Picking Performance & Labor Efficiency", ln=True)
     pdf.set_font("Arial", size=10)
@@ -189,26 +406,14 @@ def generate_warehouse_report(df, output_path="warehouse_weekly_report.pdf"):
     pdf.cell(0, 8, f"Avg Travel Distance: {avg_travel} m", ln=True)
     
     # Graph 6: Picking Accuracy by Department
-    if 'Department' in df.columns and 'Picking_Accuracy (%)' in df.columns:
-        fig, ax = plt.subplots()
-        pick_by_dept = df.groupby("Department")['Picking_Accuracy (%)'].mean()
-        pick_by_dept.plot(kind='bar', ax=ax)
-        ax.set_title("Picking Accuracy by Department")
-        save_plot(fig, "pickdept.png")
-        pdf.image("pickdept.png", w=180)
+    add_chart(pdf, charts, "pickdept", w=180)
     
     # Graph 7: Labor Efficiency
-    if 'Labor_Hours' in df.columns and 'Items_Picked' in df.columns:
-        fig, ax = plt.subplots()
-        ax.scatter(df['Labor_Hours'], df['Items_Picked'])
-        ax.set_xlabel("Labor Hours")
-        ax.set_ylabel("Items Picked")
-        ax.set_title("Labor Hours vs Items Picked")
-        save_plot(fig, "laboreff.png")
-        pdf.image("laboreff.png", w=180)
+    add_chart(pdf, charts, "laboreff", w=180)
     
     # --- V. SHIPPING & TRANSPORTATION ---
     pdf.add_page()
+    report_progress(progress, "V. Shipping & Transportation")
     pdf.set_font("Arial", 'B', 12)
     pdf.cell(0, 10, "V. Shipping & Transportation", ln=True)
     pdf.set_font("Arial", size=10)
@@ -224,22 +429,13 @@ def generate_warehouse_report(df, output_path="warehouse_weekly_report.pdf"):
         pdf.cell(0, 8, f"Preferred Shipping Modes: {', '.join(top_modes)}", ln=True)
     
     # Graph 8: Transportation Delay by Region
-    if 'Order_Region' in df.columns and 'Transportation_Delay_Days' in df.columns:
-        fig, ax = plt.subplots()
-        sns.barplot(data=df, x='Order_Region', y='Transportation_Delay_Days', ax=ax)
-        ax.set_title("Transportation Delay by Region")
-        save_plot(fig, "delayregion.png")
-        pdf.image("delayregion.png", w=180)
+    add_chart(pdf, charts, "delayregion", w=180)
     
     # Graph 9: Shipping Mode Usage
-    if 'Shipping_Mode' in df.columns:
-        fig, ax = plt.subplots()
-        df['Shipping_Mode'].value_counts().plot.pie(autopct='%1.1f%%', ax=ax)
-        ax.set_title("Shipping Mode Usage")
-        save_plot(fig, "shipmode.png")
-        pdf.image("shipmode.png", w=140)
+    add_chart(pdf, charts, "shipmode", w=140)
     
     # --- VI. SALES & PROFITABILITY ---
+    report_progress(progress, "VI. Sales & Profitability")
     pdf.set_font("Arial", 'B', 12)
     pdf.cell(0, 10, "VI. Sales & Profitability", ln=True)
     pdf.set_font("Arial", size=10)
@@ -255,23 +451,13 @@ def generate_warehouse_report(df, output_path="warehouse_weekly_report.pdf"):
     pdf.cell(0, 8, f"Avg Discount Rate: {avg_discount}%", ln=True)
     
     # Graph 10: Profit vs Discount Rate
-    if 'Discount_Rate' in df.columns and 'Profit' in df.columns:
-        fig, ax = plt.subplots()
-        sns.scatterplot(data=df, x='Discount_Rate', y='Profit', ax=ax)
-        ax.set_title("Profit vs Discount Rate")
-        save_plot(fig, "profitdisc.png")
-        pdf.image("profitdisc.png", w=180)
+    add_chart(pdf, charts, "profitdisc", w=180)
     
     # Graph 11: Sales by Category
-    if 'Category' in df.columns and 'Total_Sales' in df.columns:
-        fig, ax = plt.subplots()
-        df.groupby("Category")['Total_Sales'].sum().plot(kind='bar', ax=ax)
-        ax.set_title("Sales by Category")
-        ax.tick_params(axis='x', rotation=45)
-        save_plot(fig, "salescat.png")
-        pdf.image("salescat.png", w=180)
+    add_chart(pdf, charts, "salescat", w=180)
     
     # --- VII. SPACE UTILIZATION ---
+    report_progress(progress, "VII. Space & Resource Utilization")
     pdf.set_font("Arial", 'B', 12)
     pdf.cell(0, 10, "VII. Space & Resource Utilization", ln=True)
     pdf.set_font("Arial", size=10)
@@ -281,33 +467,21 @@ def generate_warehouse_report(df, output_path="warehouse_weekly_report.pdf"):
         pdf.cell(0, 8, f"Space Utilization (%): {avg_space:.2f}%", ln=True)
         
         # Graph 12: Space Utilization Trend
-        fig, ax = plt.subplots()
-        df['Space_Utilization (%)'].plot(ax=ax)
-        ax.set_title("Space Utilization Trend")
-        save_plot(fig, "spacetrend.png")
-        pdf.image("spacetrend.png", w=180)
+        add_chart(pdf, charts, "spacetrend", w=180)
     
     # --- VIII. REGIONAL INSIGHTS ---
+    report_progress(progress, "VIII. Regional & Customer Segment Insights")
     pdf.set_font("Arial", 'B', 12)
     pdf.cell(0, 10, "VIII. Regional & Customer Segment Insights", ln=True)
     
     # Graph 13: Orders by Region
-    if 'Order_Region' in df.columns:
-        fig, ax = plt.subplots()
-        df.groupby('Order_Region')['Order ID'].count().plot(kind='bar', ax=ax)
-        ax.set_title("Orders by Region")
-        save_plot(fig, "orders_region.png")
-        pdf.image("orders_region.png", w=180)
+    add_chart(pdf, charts, "orders_region", w=180)
     
     # Graph 14: Customer Segment Analysis
-    if 'Customer_Segment' in df.columns and 'Total_Sales' in df.columns:
-        fig, ax = plt.subplots()
-        df.groupby('Customer_Segment')['Total_Sales'].sum().plot(kind='bar', ax=ax)
-        ax.set_title("Customer Segment vs Order Value")
-        save_plot(fig, "segment_value.png")
-        pdf.image("segment_value.png", w=180)
+    add_chart(pdf, charts, "segment_value", w=180)
     
     # --- INSIGHTS SECTION ---
+    report_progress(progress, "IX. GenAI Insights")
     pdf.set_font("Arial", 'B', 12)
     pdf.cell(0, 10, "IX. GenAI Insights", ln=True)
     
@@ -319,24 +493,64 @@ def generate_warehouse_report(df, output_path="warehouse_weekly_report.pdf"):
     ]
     add_insight_section(pdf, warehouse_insights)
     
-    # Output PDF and cleanup
+    # Output PDF
+    report_progress(progress, "PDF Output")
     pdf.output(output_path)
     
-    # Clean up temporary files
-    temp_files = ["fulfill.png", "daily_orders.png", "status.png", "inv_forecast.png", 
-                  "fillrate.png", "pickdept.png", "laboreff.png", "delayregion.png", 
-                  "shipmode.png", "profitdisc.png", "salescat.png", "spacetrend.png", 
-                  "orders_region.png", "segment_value.png"]
-    
-    for f in temp_files:
-        if os.path.exists(f):
-            os.remove(f)
-    
     return output_path
 
 # ---------- Store Manager Weekly Report ----------
-def generate_store_report(df, output_path="store_weekly_report.pdf"):
+def chart_po_aging(lead_po):
+    fig, ax = plt.subplots()
+    lead_po.plot(x='Supplier Name', kind='bar', ax=ax)
+    ax.set_title("PO Aging vs Lead Time by Supplier")
+    ax.set_ylabel("Days")
+    ax.tick_params(axis='x', rotation=45)
+    return fig
+
+def chart_forecast_vs_replenish(agg):
+    fig, ax = plt.subplots()
+    agg.plot(x='Category', kind='bar', ax=ax)
+    ax.set_title("Forecast vs Replenishment by Category")
+    ax.tick_params(axis='x', rotation=45)
+    return fig
+
+def chart_ontime(agg):
+    fig, ax = plt.subplots()
+    delivery = agg.set_index('Supplier Name')['On Time Delivery'].sort_values().tail(10)
+    delivery.plot(kind='barh', ax=ax)
+    ax.set_title("On-Time Delivery Rate by Supplier")
+    return fig
+
+def chart_cost_var(agg):
+    fig, ax = plt.subplots()
+    agg.set_index('Category')['Cost Variance'].plot(kind='bar', ax=ax)
+    ax.set_title("Cost Variance by Category")
+    ax.tick_params(axis='x', rotation=45)
+    return fig
+
+STORE_CHARTS = [
+    ("po_aging", chart_po_aging, "aging_lead_time_by_supplier"),
+    ("forecast_vs_replenish", chart_forecast_vs_replenish, "forecast_replenishment_by_category"),
+    ("ontime", chart_ontime, "on_time_by_supplier"),
+    ("cost_var", chart_cost_var, "cost_variance_by_category"),
+]
+
+STORE_SECTIONS = [
+    "Charts", "I. Executive Summary", "II. Purchase Order Analysis",
+    "III. Inventory Performance", "IV. Forecasting & Replenishment",
+    "V. Supplier & Delivery Performance", "VI. Cost & Variance Analysis",
+    "VII. Quality Issues (Returns & Damages)", "VIII. Recommendations & Alerts",
+    "IX. Appendix (Sample Data)", "PDF Output",
+]
+
+def generate_store_report(df, output_path="store_weekly_report.pdf", progress=None):
     """Generate comprehensive store manager weekly performance report"""
+    report_progress(progress, "Charts")
+    charts = render_charts(df, STORE_CHARTS, "store")
+    return _assemble_store_report(df, charts, output_path, progress)
+
+def _assemble_store_report(df, charts, output_path, progress):
     pdf = PDF()
     pdf.add_page()
     
@@ -353,6 +567,7 @@ def generate_store_report(df, output_path="store_weekly_report.pdf"):
     pdf.ln(5)
     
     # I. Executive Summary
+    report_progress(progress, "I. Executive Summary")
     pdf.set_font("Arial", "B", 12)
     pdf.cell(0, 10, "I. Executive Summary", ln=True)
     pdf.set_font("Arial", size=10)
@@ -368,6 +583,7 @@ def generate_store_report(df, output_path="store_weekly_report.pdf"):
         pdf.cell(0, 10, f"{k}: {v}", ln=True)
     
     # II. Purchase Order Analysis
+    report_progress(progress, "II. Purchase Order Analysis")
     pdf.set_font("Arial", "B", 12)
     pdf.cell(0, 10, "II. Purchase Order Analysis", ln=True)
     pdf.set_font("Arial", size=10)
@@ -385,17 +601,10 @@ def generate_store_report(df, output_path="store_weekly_report.pdf"):
             pdf.cell(0, 10, f"{k}: {v}", ln=True)
     
     # Graph: PO Aging vs Lead Time
-    if 'Supplier Name' in df.columns and 'PO Aging (Days)' in df.columns and 'Lead Time (Days)' in df.columns:
-        fig, ax = plt.subplots()
-        lead_po = df.groupby('Supplier Name')[['PO Aging (Days)', 'Lead Time (Days)']].mean().reset_index()
-        lead_po.plot(x='Supplier Name', kind='bar', ax=ax)
-        ax.set_title("PO Aging vs Lead Time by Supplier")
-        ax.set_ylabel("Days")
-        ax.tick_params(axis='x', rotation=45)
-        save_plot(fig, "po_aging.png")
-        pdf.image("po_aging.png", w=180)
+    add_chart(pdf, charts, "po_aging", w=180)
     
     # III. Inventory Performance
+    report_progress(progress, "III. Inventory Performance")
     pdf.set_font("Arial", "B", 12)
     pdf.cell(0, 10, "III. Inventory Performance", ln=True)
     pdf.set_font("Arial", size=10)
@@ -411,6 +620,7 @@ def generate_store_report(df, output_path="store_weekly_report.pdf"):
         pdf.cell(0, 10, f"{k}: {v}", ln=True)
     
     # IV. Forecasting & Replenishment
+    report_progress(progress, "IV. Forecasting & Replenishment")
     pdf.set_font("Arial", "B", 12)
     pdf.cell(0, 10, "IV. Forecasting & Replenishment", ln=True)
     pdf.set_font("Arial", size=10)
@@ -423,16 +633,10 @@ def generate_store_report(df, output_path="store_weekly_report.pdf"):
         pdf.cell(0, 10, f"Suggested Replenishment: {replenish}", ln=True)
         
         # Graph: Forecast vs Replenishment by Category
-        if 'Category' in df.columns:
-            fig, ax = plt.subplots()
-            agg = df.groupby('Category')[['Forecast Demand (30d)', 'Suggested Replenishment']].sum().reset_index()
-            agg.plot(x='Category', kind='bar', ax=ax)
-            ax.set_title("Forecast vs Replenishment by Category")
-            ax.tick_params(axis='x', rotation=45)
-            save_plot(fig, "forecast_vs_replenish.png")
-            pdf.image("forecast_vs_replenish.png", w=180)
+        add_chart(pdf, charts, "forecast_vs_replenish", w=180)
     
     # V. Supplier & Delivery Performance
+    report_progress(progress, "V. Supplier & Delivery Performance")
     pdf.set_font("Arial", "B", 12)
     pdf.cell(0, 10, "V. Supplier & Delivery Performance", ln=True)
     pdf.set_font("Arial", size=10)
@@ -443,20 +647,15 @@ def generate_store_report(df, output_path="store_weekly_report.pdf"):
         
         # Late suppliers analysis
         if 'Supplier Name' in df.columns and 'PO Aging (Days)' in df.columns:
-            late_suppliers = df[df['On Time Delivery'] < 1].groupby('Supplier Name')['PO Aging (Days)'].mean().nlargest(5)
+            late_suppliers = kpi(df, "late_aging_by_supplier").set_index('Supplier Name')['PO Aging (Days)'].nlargest(5)
             for supplier, days in late_suppliers.items():
                 pdf.cell(0, 10, f"{supplier}: {days:.2f} days late", ln=True)
     
     # Graph: On-Time Delivery by Supplier
-    if 'Supplier Name' in df.columns and 'On Time Delivery' in df.columns:
-        fig, ax = plt.subplots()
-        delivery = df.groupby('Supplier Name')['On Time Delivery'].mean().sort_values().tail(10)
-        delivery.plot(kind='barh', ax=ax)
-        ax.set_title("On-Time Delivery Rate by Supplier")
-        save_plot(fig, "ontime.png")
-        pdf.image("ontime.png", w=180)
+    add_chart(pdf, charts, "ontime", w=180)
     
     # VI. Cost & Variance Analysis
+    report_progress(progress, "VI. Cost & Variance Analysis")
     pdf.set_font("Arial", "B", 12)
     pdf.cell(0, 10, "VI. Cost & Variance Analysis", ln=True)
     pdf.set_font("Arial", size=10)
@@ -472,15 +671,10 @@ def generate_store_report(df, output_path="store_weekly_report.pdf"):
         pdf.cell(0, 10, f"{k}: {v}", ln=True)
     
     # Graph: Cost Variance by Category
-    if 'Category' in df.columns and 'Cost Variance' in df.columns:
-        fig, ax = plt.subplots()
-        df.groupby('Category')['Cost Variance'].sum().plot(kind='bar', ax=ax)
-        ax.set_title("Cost Variance by Category")
-        ax.tick_params(axis='x', rotation=45)
-        save_plot(fig, "cost_var.png")
-        pdf.image("cost_var.png", w=180)
+    add_chart(pdf, charts, "cost_var", w=180)
     
     # VII. Quality Issues
+    report_progress(progress, "VII. Quality Issues (Returns & Damages)")
     pdf.set_font("Arial", "B", 12)
     pdf.cell(0, 10, "VII. Quality Issues (Returns & Damages)", ln=True)
     pdf.set_font("Arial", size=10)
@@ -496,6 +690,7 @@ def generate_store_report(df, output_path="store_weekly_report.pdf"):
         pdf.cell(0, 10, f"{k}: {v}", ln=True)
     
     # VIII. Recommendations
+    report_progress(progress, "VIII. Recommendations & Alerts")
     pdf.set_font("Arial", "B", 12)
     pdf.cell(0, 10, "VIII. Recommendations & Alerts", ln=True)
     pdf.set_font("Arial", size=10)
@@ -511,6 +706,7 @@ def generate_store_report(df, output_path="store_weekly_report.pdf"):
         pdf.multi_cell(0, 8, f"- {rec}")
     
     # IX. Appendix
+    report_progress(progress, "IX. Appendix (Sample Data)")
     pdf.set_font("Arial", "B", 12)
     pdf.cell(0, 10, "IX. Appendix (Sample Data)", ln=True)
     
@@ -519,20 +715,55 @@ def generate_store_report(df, output_path="store_weekly_report.pdf"):
         sample_cols = ['PO ID', 'Supplier Name', 'Total Cost'] if all(col in df.columns for col in ['PO ID', 'Supplier Name', 'Total Cost']) else df.columns[:3]
         draw_table(pdf, "Sample Purchase Orders", df[sample_cols].head(10))
     
-    # Output PDF and cleanup
+    # Output PDF
+    report_progress(progress, "PDF Output")
     pdf.output(output_path)
     
-    # Clean up temporary files
-    temp_files = ["po_aging.png", "forecast_vs_replenish.png", "ontime.png", "cost_var.png"]
-    for f in temp_files:
-        if os.path.exists(f):
-            os.remove(f)
-    
     return output_path
 
 # ---------- Executive Leadership Report ----------
-def generate_exec_report(df, prepared_by="Executive Team", output_path="executive_report_walmart.pdf"):
+def chart_rev_exp(rev_exp):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    rev_exp.plot(x="Business Unit", kind="bar", ax=ax)
+    ax.set_title("Revenue vs Expenses by Business Unit")
+    ax.set_ylabel("Amount ($)")
+    ax.tick_params(axis='x', rotation=45)
+    return fig
+
+def chart_roi_region(roi_by_region):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    sns.barplot(data=roi_by_region, x="Region", y="ROI (%)", ax=ax)
+    ax.set_title("ROI by Region")
+    ax.tick_params(axis='x', rotation=45)
+    return fig
+
+def chart_risk_region(risk_by_region):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    sns.barplot(data=risk_by_region, x="Region", y="Risk Score", ax=ax)
+    ax.set_title("Average Risk Score by Region")
+    ax.tick_params(axis='x', rotation=45)
+    return fig
+
+EXEC_CHARTS = [
+    ("graph_rev_exp", chart_rev_exp, "revenue_expenses_by_business_unit"),
+    ("graph_roi_region", chart_roi_region, "roi_by_region"),
+    ("graph_risk_region", chart_risk_region, "risk_score_by_region"),
+]
+
+EXEC_SECTIONS = [
+    "Charts", "I. Executive Summary", "II. Financial Overview",
+    "III. Operational Efficiency", "IV. Risk Management",
+    "V. Sustainability & ESG Metrics", "VI. Strategic Recommendations",
+    "VII. Appendix", "PDF Output",
+]
+
+def generate_exec_report(df, prepared_by="Executive Team", output_path="executive_report_walmart.pdf", progress=None):
     """Generate comprehensive executive leadership weekly insight report"""
+    report_progress(progress, "Charts")
+    charts = render_charts(df, EXEC_CHARTS, "executive")
+    return _assemble_exec_report(df, charts, prepared_by, output_path, progress)
+
+def _assemble_exec_report(df, charts, prepared_by, output_path, progress):
     pdf = PDF()
     pdf.add_page()
     
@@ -551,6 +782,7 @@ def generate_exec_report(df, prepared_by="Executive Team", output_path="executiv
     pdf.ln(5)
     
     # I. Executive Summary
+    report_progress(progress, "I. Executive Summary")
     pdf.set_font("Arial", "B", 14)
     pdf.cell(0, 10, "I. Executive Summary", ln=True)
     pdf.set_font("Arial", size=11)
@@ -560,12 +792,9 @@ def generate_exec_report(df, prepared_by="Executive Team", output_path="executiv
     roi_avg = df["ROI (%)"].mean() if "ROI (%)" in df.columns else 0
     
     # Strategic initiatives summary
-    if "Strategic Initiative" in df.columns:
-        top_initiatives = df.groupby("Strategic Initiative").agg({
-            "Initiative Impact Score": "mean",
-            "Projected Growth (%)": "mean"
-        }).sort_values("Initiative Impact Score", ascending=False).head(3)
-        top_initiative_names = ", ".join(top_initiatives.index)
+    if all(col in df.columns for col in AGGREGATES["initiative_impact"][0]):
+        top_initiatives = kpi(df, "initiative_impact").head(3)
+        top_initiative_names = ", ".join(top_initiatives["Strategic Initiative"])
     else:
         top_initiative_names = "N/A"
     
@@ -586,6 +815,7 @@ def generate_exec_report(df, prepared_by="Executive Team", output_path="executiv
     pdf.ln(5)
     
     # II. Financial Overview
+    report_progress(progress, "II. Financial Overview")
     pdf.set_font("Arial", "B", 14)
     pdf.cell(0, 10, "II. Financial Overview", ln=True)
     pdf.set_font("Arial", size=11)
@@ -603,29 +833,15 @@ def generate_exec_report(df, prepared_by="Executive Team", output_path="executiv
     pdf.ln(3)
     
     # Graph 1: Revenue vs Expenses by Business Unit
-    if "Business Unit" in df.columns and "Revenue" in df.columns and "Expenses" in df.columns:
-        fig, ax = plt.subplots(figsize=(10, 6))
-        rev_exp = df.groupby("Business Unit")[["Revenue", "Expenses"]].sum().reset_index()
-        rev_exp.plot(x="Business Unit", kind="bar", ax=ax)
-        ax.set_title("Revenue vs Expenses by Business Unit")
-        ax.set_ylabel("Amount ($)")
-        ax.tick_params(axis='x', rotation=45)
-        save_plot(fig, "graph_rev_exp.png")
-        pdf.image("graph_rev_exp.png", w=180)
+    if add_chart(pdf, charts, "graph_rev_exp", w=180):
         pdf.ln(5)
     
     # Graph 2: ROI Analysis
-    if "ROI (%)" in df.columns and "Region" in df.columns:
-        fig, ax = plt.subplots(figsize=(10, 6))
-        roi_by_region = df.groupby("Region")["ROI (%)"].mean().reset_index()
-        sns.barplot(data=roi_by_region, x="Region", y="ROI (%)", ax=ax)
-        ax.set_title("ROI by Region")
-        ax.tick_params(axis='x', rotation=45)
-        save_plot(fig, "graph_roi_region.png")
-        pdf.image("graph_roi_region.png", w=180)
+    if add_chart(pdf, charts, "graph_roi_region", w=180):
         pdf.ln(5)
     
     # III. Operational Efficiency
+    report_progress(progress, "III. Operational Efficiency")
     pdf.set_font("Arial", "B", 14)
     pdf.cell(0, 10, "III. Operational Efficiency", ln=True)
     pdf.set_font("Arial", size=11)
@@ -642,6 +858,7 @@ def generate_exec_report(df, prepared_by="Executive Team", output_path="executiv
     pdf.ln(3)
     
     # IV. Risk Management
+    report_progress(progress, "IV. Risk Management")
     pdf.set_font("Arial", "B", 14)
     pdf.cell(0, 10, "IV. Risk Management", ln=True)
     pdf.set_font("Arial", size=11)
@@ -654,17 +871,11 @@ def generate_exec_report(df, prepared_by="Executive Team", output_path="executiv
         pdf.cell(0, 10, f"High Risk Items: {high_risk_count}", ln=True)
         
         # Graph: Risk Score by Region
-        if "Region" in df.columns:
-            fig, ax = plt.subplots(figsize=(10, 6))
-            risk_by_region = df.groupby("Region")["Risk Score"].mean().reset_index()
-            sns.barplot(data=risk_by_region, x="Region", y="Risk Score", ax=ax)
-            ax.set_title("Average Risk Score by Region")
-            ax.tick_params(axis='x', rotation=45)
-            save_plot(fig, "graph_risk_region.png")
-            pdf.image("graph_risk_region.png", w=180)
+        if add_chart(pdf, charts, "graph_risk_region", w=180):
             pdf.ln(5)
     
     # V. Sustainability Metrics
+    report_progress(progress, "V. Sustainability & ESG Metrics")
     pdf.set_font("Arial", "B", 14)
     pdf.cell(0, 10, "V. Sustainability & ESG Metrics", ln=True)
     pdf.set_font("Arial", size=11)
@@ -680,6 +891,7 @@ def generate_exec_report(df, prepared_by="Executive Team", output_path="executiv
     pdf.ln(3)
     
     # VI. Strategic Recommendations
+    report_progress(progress, "VI. Strategic Recommendations")
     pdf.set_font("Arial", "B", 14)
     pdf.cell(0, 10, "VI. Strategic Recommendations", ln=True)
     pdf.set_font("Arial", size=11)
@@ -695,6 +907,7 @@ def generate_exec_report(df, prepared_by="Executive Team", output_path="executiv
         pdf.multi_cell(0, 8, f"- {rec}")
     
     # VII. Appendix
+    report_progress(progress, "VII. Appendix")
     pdf.set_font("Arial", "B", 14)
     pdf.cell(0, 10, "VII. Appendix", ln=True)
     
@@ -703,15 +916,10 @@ def generate_exec_report(df, prepared_by="Executive Team", output_path="executiv
         sample_cols = df.columns[:5]  # First 5 columns
         draw_table(pdf, "Sample Strategic Data", df[sample_cols].head(10))
     
-    # Output PDF and cleanup
+    # Output PDF
+    report_progress(progress, "PDF Output")
     pdf.output(output_path)
     
-    # Clean up temporary files
-    temp_files = ["graph_rev_exp.png", "graph_roi_region.png", "graph_risk_region.png"]
-    for f in temp_files:
-        if os.path.exists(f):
-            os.remove(f)
-    
     print(f"Executive Leadership Report generated: {output_path}")
     return output_path
 
@@ -0,0 +1,147 @@
+# reports/report_jobs.py
+# Background report jobs: bounded worker pool, per-section progress, cancellation
+
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("REPORT_JOB_WORKERS", "2"))
+# Jobs allowed to wait for a worker; submissions beyond this are rejected
+JOB_QUEUE_DEPTH = int(os.getenv("REPORT_JOB_QUEUE_DEPTH", "8"))
+# Finished jobs are forgotten after this many seconds
+JOB_TTL = int(os.getenv("REPORT_JOB_TTL", "3600"))
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+@dataclass
+class ReportJob:
+    id: str
+    report_type: str
+    sections: list
+    status: str = "queued"  # queued | running | done | failed | cancelled
+    current_section: str = None
+    sections_completed: list = field(default_factory=list)
+    pdf_path: str = None
+    error: str = None
+    created_at: float = field(default_factory=time.time)
+    started_at: float = None
+    finished_at: float = None
+    cancel_requested: threading.Event = field(default_factory=threading.Event)
+    future: object = None
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    def progress(self, section):
+        """Progress callback handed to the report generators"""
+        if self.cancel_requested.is_set():
+            raise JobCancelled()
+        if self.current_section is not None:
+            self.sections_completed.append(self.current_section)
+        self.current_section = section
+
+    def to_dict(self):
+        # A cache hit finishes without reporting any sections
+        completed = self.sections if self.status == "done" else self.sections_completed
+        return {
+            "job_id": self.id,
+            "report_type": self.report_type,
+            "status": self.status,
+            "progress": {
+                "current_section": None if self.finished else self.current_section,
+                "sections_completed": list(completed),
+                "sections_total": len(self.sections),
+                "percent": round(100 * len(completed) / len(self.sections), 1) if self.sections else 0,
+            },
+            "cancel_requested": self.cancel_requested.is_set(),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class ReportJobManager:
+    def __init__(self, max_workers=JOB_WORKERS, max_queue=JOB_QUEUE_DEPTH, ttl=JOB_TTL):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, report_type: str, sections: list, build) -> ReportJob:
+        """Queue build(job) -> pdf_path; raises JobQueueFull when saturated"""
+        with self._lock:
+            self._prune()
+            active = sum(1 for job in self._jobs.values() if not job.finished)
+            if active >= self.max_workers + self.max_queue:
+                raise JobQueueFull(f"{active} report jobs already queued or running")
+
+            job = ReportJob(id=uuid.uuid4().hex, report_type=report_type, sections=list(sections))
+            self._jobs[job.id] = job
+            job.future = self._executor.submit(self._run, job, build)
+        logger.info(f"Queued {report_type} report job {job.id}")
+        return job
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str):
+        """Request cancellation; queued jobs stop at once, running ones at the next section"""
+        job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return job
+        job.cancel_requested.set()
+        if job.future is not None and job.future.cancel():
+            self._finish(job, "cancelled")
+        return job
+
+    def shutdown(self):
+        for job in list(self._jobs.values()):
+            if not job.finished:
+                self.cancel(job.id)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job, build):
+        if job.cancel_requested.is_set():
+            self._finish(job, "cancelled")
+            return
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.pdf_path = build(job)
+            self._finish(job, "done")
+        except JobCancelled:
+            logger.info(f"Report job {job.id} cancelled during '{job.current_section}'")
+            self._finish(job, "cancelled")
+        except Exception as e:
+            logger.error(f"Report job {job.id} failed: {e}")
+            job.error = str(e)
+            self._finish(job, "failed")
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [j.id for j in self._jobs.values() if j.finished and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+
+report_jobs = ReportJobManager()
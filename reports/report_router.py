@@ -1,24 +1,107 @@
-from fastapi import APIRouter
+import os
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Request, Response
 from fastapi.responses import FileResponse
-import pandas as pd
-from reports.report_generator import generate_warehouse_report, generate_store_report, generate_exec_report
+from registry.dataset_registry import registry
+from reports.report_cache import report_cache, report_key, etag_for, etag_matches
+from reports.report_generator import (
+    generate_warehouse_report, generate_store_report, generate_exec_report,
+    WAREHOUSE_SECTIONS, STORE_SECTIONS, EXEC_SECTIONS,
+)
+from reports.report_jobs import report_jobs, JobQueueFull
 
 router = APIRouter()
 
+# report type -> (dataset, generator, sections, download filename)
+REPORTS = {
+    "warehouse": ("warehouse", generate_warehouse_report, WAREHOUSE_SECTIONS, "warehouse_report.pdf"),
+    "store": ("store", generate_store_report, STORE_SECTIONS, "store_report.pdf"),
+    "executive": ("executive", generate_exec_report, EXEC_SECTIONS, "executive_report.pdf"),
+}
+
+
+def report_snapshot_key(report_type: str):
+    """Return (dataset snapshot, cache key) for the report as it would be built now"""
+    dataset = REPORTS[report_type][0]
+    snapshot = registry.get(dataset)
+    # Reports print today's date, so a new day is a new report even on unchanged data
+    params = {"date": datetime.today().strftime('%Y-%m-%d')}
+    return snapshot, report_key(report_type, params, snapshot.version)
+
+
+def build_report(report_type: str, snapshot, key: str, progress=None) -> str:
+    generator = REPORTS[report_type][1]
+    return report_cache.get_or_build(
+        key, lambda path: generator(snapshot.df, output_path=path, progress=progress)
+    )
+
+
+def cached_report(request: Request, report_type: str):
+    snapshot, key = report_snapshot_key(report_type)
+    etag = etag_for(key)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    pdf_path = build_report(report_type, snapshot, key)
+    return FileResponse(pdf_path, media_type="application/pdf", filename=REPORTS[report_type][3], headers=headers)
+
+
 @router.get("/warehouse")
-def generate_warehouse():
-    df = pd.read_csv("data/warehouse_dataset.csv")
-    pdf_path = generate_warehouse_report(df)
-    return FileResponse(pdf_path, media_type="application/pdf", filename="warehouse_report.pdf")
+def generate_warehouse(request: Request):
+    return cached_report(request, "warehouse")
 
 @router.get("/store")
-def generate_store():
-    df = pd.read_csv("data/store_manager_dataset.csv")
-    pdf_path = generate_store_report(df)
-    return FileResponse(pdf_path, media_type="application/pdf", filename="store_report.pdf")
+def generate_store(request: Request):
+    return cached_report(request, "store")
 
 @router.get("/executive")
-def generate_exec():
-    df = pd.read_csv("data/executive_insights_dataset.csv")
-    pdf_path = generate_exec_report(df)
-    return FileResponse(pdf_path, media_type="application/pdf", filename="executive_report.pdf")
+def generate_exec(request: Request):
+    return cached_report(request, "executive")
+
+
+# ---------- Background jobs ----------
+@router.post("/{report_type}/jobs", status_code=202)
+def submit_report_job(report_type: str):
+    if report_type not in REPORTS:
+        raise HTTPException(status_code=404, detail=f"Unsupported report type: {report_type}")
+
+    sections = REPORTS[report_type][2]
+    snapshot, key = report_snapshot_key(report_type)
+    try:
+        job = report_jobs.submit(
+            report_type, sections, lambda job: build_report(report_type, snapshot, key, progress=job.progress)
+        )
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    return {**job.to_dict(), "status_url": f"/report/jobs/{job.id}", "pdf_url": f"/report/jobs/{job.id}/pdf"}
+
+
+@router.get("/jobs/{job_id}")
+def get_report_job(job_id: str):
+    job = report_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown report job")
+    return job.to_dict()
+
+
+@router.get("/jobs/{job_id}/pdf")
+def get_report_job_pdf(job_id: str):
+    job = report_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown report job")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Report job is {job.status}")
+    if not os.path.exists(job.pdf_path):
+        # Evicted from the report cache since the job finished
+        raise HTTPException(status_code=410, detail="Report is no longer available, submit a new job")
+    return FileResponse(job.pdf_path, media_type="application/pdf", filename=REPORTS[job.report_type][3])
+
+
+@router.delete("/jobs/{job_id}")
+def cancel_report_job(job_id: str):
+    job = report_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown report job")
+    return job.to_dict()
@@ -0,0 +1,87 @@
+import time
+
+import pandas as pd
+
+from agents.answer_cache import AnswerCache, answer_key, code_key, normalize_question, schema_signature
+
+
+def make_cache(tmp_path, **limits):
+    return AnswerCache(path=str(tmp_path / "answers.sqlite"), **limits)
+
+
+def test_normalize_question_ignores_case_whitespace_and_trailing_punctuation():
+    assert normalize_question("  Top 5   products BY revenue?! ") == "top 5 products by revenue"
+
+
+def test_answer_key_depends_on_agent_schema_and_version():
+    key = answer_key("StoreAgent", "Total cost?", "schema", "v1")
+    assert key == answer_key("StoreAgent", "total   cost", "schema", "v1")
+    assert key != answer_key("WarehouseAgent", "total cost", "schema", "v1")
+    assert key != answer_key("StoreAgent", "total cost", "other", "v1")
+    assert key != answer_key("StoreAgent", "total cost", "schema", "v2")
+
+
+def test_code_key_survives_data_refresh():
+    assert code_key("StoreAgent", "Total cost", "schema") == code_key("StoreAgent", "total cost?", "schema")
+
+
+def test_schema_signature_tracks_columns_and_dtypes():
+    df = pd.DataFrame({"a": [1, 2], "b": ["x", "y"]})
+    assert schema_signature(df) == schema_signature(df.copy())
+    assert schema_signature(df) != schema_signature(df.rename(columns={"a": "c"}))
+    assert schema_signature(df) != schema_signature(df.astype({"a": float}))
+
+
+def test_round_trip(tmp_path):
+    cache = make_cache(tmp_path)
+    result = {"response": {"answer": "ok", "result": [1, 2]}, "status": "success", "agent_used": "StoreAgent"}
+    cache.put("k", "StoreAgent", "q", result)
+    assert cache.get("k") == result
+    assert cache.get("missing") is None
+
+
+def test_expired_answers_are_dropped(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path, ttl=60)
+    cache.put("k", "StoreAgent", "q", {"status": "success"})
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get("k") is None
+    monkeypatch.setattr(time, "time", lambda: now)
+    assert cache.get("k") is None  # deleted, not just hidden
+
+
+def test_least_recently_used_answers_are_evicted_over_the_size_limit(tmp_path, monkeypatch):
+    entry = {"response": "x" * 100}
+    size = len('{"response": "' + "x" * 100 + '"}')
+    cache = make_cache(tmp_path, max_bytes=2 * size)
+    clock = iter(range(1_000_000_000, 1_000_000_100))
+    monkeypatch.setattr(time, "time", lambda: next(clock))
+
+    cache.put("a", "StoreAgent", "a", entry)
+    cache.put("b", "StoreAgent", "b", entry)
+    assert cache.get("a") == entry  # a is now more recently used than b
+    cache.put("c", "StoreAgent", "c", entry)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == entry
+    assert cache.get("c") == entry
+
+
+def test_code_table_has_its_own_ttl(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path, ttl=60, code_ttl=3600)
+    cache.put("k", "StoreAgent", "q", {"status": "success"})
+    cache.put_code("k", "StoreAgent", "q", "answer", "result = 1")
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 120)
+    assert cache.get("k") is None
+    assert cache.get_code("k") == {"answer": "answer", "code": "result = 1"}
+    cache.drop_code("k")
+    assert cache.get_code("k") is None
+
+
+def test_unserialisable_results_are_skipped(tmp_path):
+    cache = make_cache(tmp_path)
+    circular = {}
+    circular["self"] = circular
+    cache.put("c", "StoreAgent", "q", circular)
+    assert cache.get("c") is None
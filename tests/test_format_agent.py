@@ -0,0 +1,81 @@
+import pytest
+
+from agents import format_agent, llm_client
+from agents.format_agent import fix_escapes, fix_llm_output, format_with_llm, parse_llm_output
+
+
+def test_plain_json():
+    parsed = parse_llm_output('{"answer": "Total", "code": "result = df[\'Revenue\'].sum()"}')
+    assert parsed == {"answer": "Total", "code": "result = df['Revenue'].sum()"}
+
+
+def test_fenced_json_with_surrounding_prose():
+    raw = 'Here you go:\n```json\n{"answer": "a", "code": "result = 1"}\n```\nHope this helps {sic}.'
+    assert parse_llm_output(raw) == {"answer": "a", "code": "result = 1"}
+
+
+def test_trailing_prose_with_braces():
+    raw = '{"answer": "a", "code": "result = {\'x\': 1}"} Note: uses a dict {like this}.'
+    assert parse_llm_output(raw) == {"answer": "a", "code": "result = {'x': 1}"}
+
+
+def test_markdown_escaped_underscore_is_unescaped():
+    raw = '{"answer": "a", "code": "result = df[\'Total\\_Sales\'].sum()"}'
+    assert parse_llm_output(raw)["code"] == "result = df['Total_Sales'].sum()"
+
+
+def test_regex_escape_keeps_its_backslash():
+    raw = '{"answer": "a", "code": "result = df[df[\'Product Name\'].str.contains(\'\\d+\')]"}'
+    assert parse_llm_output(raw)["code"] == "result = df[df['Product Name'].str.contains('\\d+')]"
+
+
+def test_valid_json_escapes_are_untouched():
+    assert fix_escapes('"a\\nb \\"q\\" \\\\d \\u00e9"') == '"a\\nb \\"q\\" \\\\d \\u00e9"'
+
+
+def test_raw_newlines_in_code_are_accepted():
+    raw = '{"answer": "a", "code": "x = 1\nresult = x"}'
+    assert parse_llm_output(raw)["code"] == "x = 1\nresult = x"
+
+
+def test_non_dict_json_is_rejected():
+    assert parse_llm_output('["answer", "code"]') is None
+    assert parse_llm_output('"just a string"') is None
+
+
+def test_missing_or_empty_code_is_rejected():
+    assert parse_llm_output('{"answer": "a"}') is None
+    assert parse_llm_output('{"answer": "a", "code": "  "}') is None
+    assert parse_llm_output('{"answer": 1, "code": "result = 1"}') is None
+
+
+def test_no_json_at_all():
+    assert parse_llm_output("I cannot answer that.") is None
+
+
+@pytest.fixture
+def replies(monkeypatch):
+    """Stand-in format models: model name -> corrected output it returns"""
+    outputs = {}
+    monkeypatch.setattr(format_agent, "invoke_llm", lambda chain, inputs, model, prompt: outputs[model])
+    monkeypatch.setitem(llm_client.MODEL_TIERS, "format", "small,large")
+    return outputs
+
+
+@pytest.mark.parametrize("corrected", [
+    '["answer", "code"]',
+    '"just a string"',
+    '{"answer": "a", "code": ["result = 1"]}',
+    '{"answer": {"text": "a"}, "code": "result = 1"}',
+    '{"answer": "a", "code": "result = 1"',
+])
+def test_format_with_llm_returns_an_error_for_malformed_output(replies, corrected):
+    replies["small"] = corrected
+    parsed = format_with_llm("garbled", "small")
+    assert set(parsed) == {"error"}
+
+
+def test_malformed_format_output_escalates_to_the_next_tier(replies):
+    replies["small"] = '{"answer": "a", "code": {"line": "result = 1"}}'
+    replies["large"] = '{"answer": "a", "code": "result = 1"}'
+    assert fix_llm_output("garbled") == {"answer": "a", "code": "result = 1"}
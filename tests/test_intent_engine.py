@@ -0,0 +1,96 @@
+import pandas as pd
+import pytest
+
+from agents.intent_engine import answer_question, schema_for
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        "Product Name": ["Alpha", "Beta", "Gamma", "Delta", "Alpha", "Beta"],
+        "Region": ["North", "South", "North", "East", "South", "East"],
+        "Business Unit": ["Retail", "Retail", "Online", "Online", "Retail", "Online"],
+        "Risk Category": ["High", "Low", "Medium", "High", "Low", "Medium"],
+        "Revenue": [100.0, 200.0, 300.0, 400.0, 500.0, 600.0],
+        "Expenses": [50.0, 80.0, 90.0, 100.0, 120.0, 150.0],
+        "Net Profit": [50.0, 120.0, 210.0, 300.0, 380.0, 450.0],
+        "ROI (%)": [10.0, 20.0, 30.0, 40.0, 50.0, 60.0],
+        "Risk Score": [0.9, 0.2, 0.5, 0.8, 0.1, 0.4],
+        "Warehouse ID": ["WH_1", "WH_2", "WH_3", "WH_4", "WH_1", "WH_2"],
+    })
+
+
+@pytest.mark.parametrize("question", [
+    "total revenue for non north regions",
+    "total revenue for the north and south regions",
+    "average roi by product excluding the south region",
+    "total expenses by business unit and region",
+    "total revenue from the top 3 products",
+    "average risk score for high risk region",
+    "total revenue for regions other than north",
+    "total revenue by region per business unit",
+    "top 3 products by revenue by region",
+    "which region has the highest roi among the top 2 products",
+    "total revenue for warehouse 7",
+    "average risk score for region q",
+    "average risk score for region 5",
+    "total revenue for product a",
+    "total expenses for business unit x",
+])
+def test_compound_and_qualified_questions_are_left_to_the_llm(df, question):
+    assert answer_question(df, question) is None
+
+
+def test_top_n(df):
+    answered = answer_question(df, "Top 2 products by revenue")
+    assert answered["intent"] == "top_n"
+    assert [row["Product Name"] for row in answered["result"]] == ["Beta", "Alpha"]
+
+
+def test_group_by(df):
+    answered = answer_question(df, "average roi by region")
+    assert answered["intent"] == "group_by"
+    assert {row["Region"]: row["ROI (%)"] for row in answered["result"]} == {"North": 20.0, "South": 35.0, "East": 50.0}
+
+
+def test_extreme(df):
+    answered = answer_question(df, "Which region has the highest ROI?")
+    assert answered["intent"] == "extreme"
+    assert answered["answer"].startswith("East")
+
+
+def test_filtered_with_the_dimension_named(df):
+    answered = answer_question(df, "total revenue for the north region")
+    assert answered["intent"] == "filtered"
+    assert answered["result"] == 400.0
+
+
+@pytest.mark.parametrize("question", [
+    "average roi for region", "average roi for each region", "average roi for all regions",
+    "average roi for every area",
+])
+def test_filtered_naming_a_dimension_groups_by_it(df, question):
+    assert answer_question(df, question)["answer"] == "Average ROI (%) by Region."
+
+
+def test_filtered_on_a_warehouse(df):
+    assert answer_question(df, "total revenue for warehouse wh_1")["result"] == 600.0
+
+
+def test_filtered_with_another_dimension_named_is_not_answered(df):
+    # "north" is a Region value; "business unit" is not its dimension
+    assert answer_question(df, "total revenue for north business unit") is None
+
+
+def test_overall(df):
+    answered = answer_question(df, "total net profit")
+    assert answered["intent"] == "overall"
+    assert answered["result"] == 1510.0
+
+
+def test_the_whole_phrase_must_name_the_column(df):
+    schema = schema_for(df)
+    assert schema.resolve("risk region", schema.dimensions) is None
+    assert schema.resolve("business unit", schema.dimensions) == "Business Unit"
+    assert schema.value("high risk region") is None
+    assert schema.value("the north region") == ("Region", "North")
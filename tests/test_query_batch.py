@@ -0,0 +1,60 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from queries import query_router
+
+
+def events(body: str):
+    parsed = []
+    for block in body.strip().split("\n\n"):
+        event, data = block.split("\n", 1)
+        parsed.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return parsed
+
+
+@pytest.fixture
+def client(monkeypatch):
+    asked = []
+
+    def quick_answer(dataset, question, agent_name):
+        if question.startswith("cached"):
+            return {"response": {"answer": question}, "status": "success"}
+        return None
+
+    async def run_coalesced(agent_fn, dataset, question, agent_name):
+        asked.append(question)
+        return {"response": {"answer": question}, "status": "success", "agent_used": agent_name}
+
+    monkeypatch.setattr(query_router, "quick_answer", quick_answer)
+    monkeypatch.setattr(query_router, "run_coalesced", run_coalesced)
+    app = FastAPI()
+    app.include_router(query_router.router, prefix="/query")
+    client = TestClient(app)
+    client.asked = asked
+    return client
+
+
+def test_repeated_questions_are_answered_once(client):
+    questions = ["Total revenue?", "total  revenue", "cached answer", "Cached answer?", "average roi"]
+    response = client.post("/query/executive/batch", json={"questions": questions})
+    assert response.status_code == 200
+    received = events(response.text)
+    results = [data for event, data in received if event == "result"]
+    done = received[-1]
+    assert done[0] == "done"
+    assert sorted(result["index"] for result in results) == list(range(len(questions)))
+    assert all(result["agent_used"] == "ExecutiveAgent" for result in results)
+    assert sorted(client.asked) == ["Total revenue?", "average roi"]
+    assert done[1]["questions"] == 5
+    assert done[1]["unique"] == 3
+    assert done[1]["answered_without_llm"] == 1
+
+
+def test_batch_limits(client):
+    assert client.post("/query/executive/batch", json={"questions": []}).status_code == 400
+    assert client.post("/query/nobody/batch", json={"questions": ["q"]}).status_code == 404
+    too_many = ["q"] * (query_router.QUERY_BATCH_MAX + 1)
+    assert client.post("/query/executive/batch", json={"questions": too_many}).status_code == 400
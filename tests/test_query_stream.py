@@ -0,0 +1,57 @@
+import asyncio
+import threading
+
+from agents.llm_client import agent_limit
+from queries import query_router
+
+
+def test_stream_keeps_the_agent_slot_until_the_pipeline_stops(monkeypatch):
+    release = threading.Event()
+    stopped = threading.Event()
+
+    def agent_events(dataset, question, agent_name, stream=False):
+        try:
+            yield "token", "re"
+            release.wait(5)
+            yield "token", "sult"
+            yield "result", {"response": "done", "status": "success"}
+        finally:
+            stopped.set()
+
+    monkeypatch.setattr(query_router, "agent_events", agent_events)
+    limit = agent_limit("StreamTestAgent")
+
+    async def main():
+        response = query_router.stream_agent_query("executive", "q", "StreamTestAgent")
+        body = response.body_iterator
+        assert "event: token" in await body.__anext__()
+        # The client goes away while the pipeline is still busy
+        await body.aclose()
+        await asyncio.sleep(0.05)
+        held = limit.stats()["in_flight"]
+        release.set()
+        while not stopped.is_set():
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        return held
+
+    assert asyncio.run(main()) == 1
+    assert limit.stats()["in_flight"] == 0
+
+
+def test_stream_releases_the_slot_when_it_completes(monkeypatch):
+    def agent_events(dataset, question, agent_name, stream=False):
+        yield "result", {"response": "done", "status": "success"}
+
+    monkeypatch.setattr(query_router, "agent_events", agent_events)
+    limit = agent_limit("StreamDoneAgent")
+
+    async def main():
+        response = query_router.stream_agent_query("executive", "q", "StreamDoneAgent")
+        chunks = [chunk async for chunk in response.body_iterator]
+        await asyncio.sleep(0.05)
+        return chunks
+
+    chunks = asyncio.run(main())
+    assert chunks[-1].startswith("event: result")
+    assert limit.stats()["in_flight"] == 0
@@ -0,0 +1,62 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from agents import sandbox
+from agents.sandbox import copy_on_write, execute, run_shaped
+
+
+@pytest.fixture
+def shared():
+    return pd.DataFrame({"Region": ["North", "South", "North"], "Revenue": [1.0, 2.0, 3.0]})
+
+
+def test_importing_the_sandbox_leaves_pandas_defaults_alone():
+    assert pd.get_option("mode.copy_on_write") is False
+
+
+def test_copy_on_write_only_while_code_runs(shared):
+    seen = execute("result = pd.get_option('mode.copy_on_write')", shared)
+    assert seen is (True if sandbox.SANDBOX_COPY_ON_WRITE else False)
+    assert pd.get_option("mode.copy_on_write") is False
+
+
+def test_writes_stay_in_the_sandbox(shared):
+    before = shared.copy()
+    run_shaped("df['Revenue'] = 0\ndf.loc[0, 'Region'] = 'West'\ndf.sort_values('Revenue', inplace=True)\nresult = 1", shared)
+    pd.testing.assert_frame_equal(shared, before)
+
+
+def test_numpy_views_are_read_only(shared):
+    with pytest.raises(ValueError):
+        run_shaped("df['Revenue'].values[0] = 99\nresult = 1", shared)
+    assert shared.loc[0, "Revenue"] == 1.0
+
+
+def test_overlapping_runs_keep_copy_on_write_on():
+    first_inside = threading.Event()
+    release_first = threading.Event()
+    seen = []
+
+    def first():
+        with copy_on_write():
+            first_inside.set()
+            release_first.wait(5)
+            seen.append(pd.get_option("mode.copy_on_write"))
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    first_inside.wait(5)
+    with copy_on_write():
+        pass  # a second run finishing first must not switch it off
+    release_first.set()
+    thread.join()
+    assert seen == [sandbox.SANDBOX_COPY_ON_WRITE]
+    assert pd.get_option("mode.copy_on_write") is False
+
+
+def test_shape_result():
+    assert run_shaped("result = df.groupby('Region')['Revenue'].sum()", pd.DataFrame(
+        {"Region": ["a", "b", "a"], "Revenue": [1, 2, 3]})) == {"a": 4, "b": 2}
+    assert run_shaped("x = 1", pd.DataFrame({"a": [1]})) is None
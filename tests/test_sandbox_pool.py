@@ -0,0 +1,97 @@
+import time
+
+import pandas as pd
+import pytest
+
+from agents.sandbox_pool import QueryFailed, SandboxError, SandboxPool
+from registry.dataset_registry import registry
+
+RUNAWAY = "x = 0\nwhile True:\n    x += 1"
+
+
+@pytest.fixture(scope="module")
+def pool():
+    registry.preload()
+    pool = SandboxPool(size=2, timeout=4, cpu_seconds=1, max_memory_mb=300)
+    pool.start()
+    yield pool
+    pool.shutdown()
+
+
+@pytest.fixture
+def executive():
+    return registry.frame("executive")
+
+
+def test_runs_against_the_zygote_frame(pool, executive):
+    shipped = pool.shipped
+    assert pool.run("result = len(df)", executive) == len(executive)
+    assert pool.shipped == shipped
+
+
+def test_code_errors_keep_the_worker(pool, executive):
+    replaced = pool.replaced
+    with pytest.raises(QueryFailed):
+        pool.run("result = df['No Such Column']", executive)
+    assert pool.replaced == replaced
+
+
+def test_cpu_limit_kills_and_replaces_the_worker(pool, executive):
+    replaced = pool.replaced
+    start = time.monotonic()
+    with pytest.raises(SandboxError, match="CPU limit"):
+        pool.run(RUNAWAY, executive)
+    assert time.monotonic() - start < 3
+    assert pool.replaced == replaced + 1
+    assert pool.stats()["processes"] == 2
+    assert pool.run("result = 1", executive) == 1
+
+
+def test_wall_clock_timeout(executive):
+    pool = SandboxPool(size=1, timeout=1, cpu_seconds=60, max_memory_mb=300)
+    pool.start()
+    try:
+        with pytest.raises(SandboxError, match="time limit"):
+            pool.run(RUNAWAY, executive)
+        assert pool.replaced == 1
+        assert pool.run("result = 2", executive) == 2
+    finally:
+        pool.shutdown()
+
+
+def test_memory_limit(pool, executive):
+    with pytest.raises(SandboxError, match="memory limit"):
+        pool.run("result = list(range(10**8))", executive)
+    assert pool.run("result = 3", executive) == 3
+
+
+def test_frames_the_zygote_lacks_are_sent_to_a_worker(pool, executive):
+    # e.g. the snapshot a request still holds after a reload swapped in a new version
+    stale = executive.copy()
+    shipped = pool.shipped
+    assert pool.run("result = int(df['Revenue'].count())", stale) == len(stale)
+    assert pool.shipped == shipped + 1
+    # and they stay under the limits instead of running in the API process
+    with pytest.raises(SandboxError, match="CPU limit"):
+        pool.run(RUNAWAY, pd.DataFrame({"a": [1]}))
+
+
+def test_worker_that_died_while_idle_is_replaced(pool, executive):
+    import os
+    import signal
+
+    worker = pool._idle.get()
+    os.kill(worker.pid, signal.SIGKILL)
+    time.sleep(0.2)
+    pool._idle.put(worker)
+    replaced = pool.replaced
+    for _ in range(2):  # whichever worker comes up first
+        assert pool.run("result = 4", executive) == 4
+    assert pool.replaced == replaced + 1
+
+
+def test_disabled_pool_runs_inline():
+    pool = SandboxPool(size=0)
+    pool.start()
+    assert not pool.enabled
+    assert pool.run("result = len(df)", pd.DataFrame({"a": [1, 2]})) == 2
@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from agents.schema_context import BENCHMARK_QUESTIONS, benchmark_prompts, compare_prompts
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({"Region": ["North", "South"], "Revenue": [1.0, 2.0]})
+
+
+def test_baseline_prompt_lists_only_the_column_names(df):
+    prompts = benchmark_prompts(df)
+    baseline = prompts["baseline"]("total revenue")
+    assert "## Example columns:\n'Region', 'Revenue'\n" in baseline
+    assert "'North'" not in baseline
+    assert "'Region' (object): 'North', 'South'" in prompts["schema"]("total revenue")
+    assert baseline.rstrip().endswith("total revenue")
+
+
+def test_compare_prompts_reports_both_prompts_from_prompt_stats(df):
+    sent = []
+
+    def invoke(prompt, stats):
+        sent.append(prompt)
+        info = {"prompt_eval_count": len(prompt) // 4, "prompt_eval_duration": 2e8}
+        stats.on_llm_end(SimpleNamespace(generations=[[SimpleNamespace(generation_info=info)]]))
+
+    results = compare_prompts(df, invoke)
+    assert len(sent) == 2 * len(BENCHMARK_QUESTIONS)
+    # All baseline calls first, so each prompt runs against its own cached prefix
+    assert all("## Example columns:" in prompt for prompt in sent[:len(BENCHMARK_QUESTIONS)])
+    for question in BENCHMARK_QUESTIONS:
+        for name in ("baseline", "schema"):
+            run = results[question][name]
+            assert run["prompt_tokens"] == run["chars"] // 4
+            assert run["prefill_s"] == 0.2
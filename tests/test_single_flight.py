@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from queries.single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_computation():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"status": "success"}
+
+    async def main():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.do("key", compute) for _ in range(5)))
+        assert len(flight) == 0
+        return results
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+
+
+def test_errors_are_shared_and_not_cached():
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("model down")
+
+    async def main():
+        flight = SingleFlight()
+        outcomes = await asyncio.gather(flight.do("key", fail), flight.do("key", fail), return_exceptions=True)
+        assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+        with pytest.raises(RuntimeError):
+            await flight.do("key", fail)
+
+    asyncio.run(main())
+    assert len(calls) == 2
+
+
+def test_a_cancelled_caller_does_not_cancel_the_others():
+    async def compute():
+        await asyncio.sleep(0.05)
+        return 42
+
+    async def main():
+        flight = SingleFlight()
+        first = asyncio.ensure_future(flight.do("key", compute))
+        second = asyncio.ensure_future(flight.do("key", compute))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == 42